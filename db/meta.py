@@ -1,12 +1,40 @@
-from sqlalchemy import create_engine
+from typing import List, Sequence
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
 
 from settings import settings
 
 
-engine = create_engine(
-    settings.DB_URI,
-    echo=settings.DB_ECHO
-)
+def get_shard_schemas(db_urls: Sequence[str]) -> List[str]:
+    """Names the additional database shards are attached under."""
+
+    return [f"shard_{number}" for number in range(1, len(db_urls))]
+
+
+def create_db_engine(db_urls: Sequence[str]) -> Engine:
+    """Create engine connected to the first database with the rest ones attached.
+
+    SQLite allows to attach 10 databases by default, so up to 11 shards can be used.
+    """
+
+    db_engine = create_engine(
+        f"{settings.DB_DRIVER}{db_urls[0]}",
+        echo=settings.DB_ECHO
+    )
+
+    shards = list(zip(get_shard_schemas(db_urls), db_urls[1:]))
+    if shards:
+        @event.listens_for(db_engine, "connect")
+        def attach_shards(dbapi_connection, connection_record):
+            for schema, db_url in shards:
+                dbapi_connection.execute(f'ATTACH DATABASE ? AS "{schema}"', (db_url,))
+
+    return db_engine
+
+
+engine = create_db_engine(settings.DB_URLS)
+SHARD_SCHEMAS = get_shard_schemas(settings.DB_URLS)
 
 Session = sessionmaker(engine)
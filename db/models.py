@@ -1,10 +1,18 @@
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import column, literal, select, table, Table, union_all
 from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import ColumnElement, TableClause
 
 from db.meta import engine
 
 __all__ = (
     "Customer",
     "Invoice",
+    "TableFilter",
+    "get_shard_tables",
+    "get_sharded_models",
 )
 
 
@@ -13,3 +21,93 @@ base.prepare(autoload_with=engine)
 
 Customer = base.classes.Customer
 Invoice = base.classes.Invoice
+
+# Invoices of different shards may have the same ids, while ORM requires primary
+# keys to be unique. Ids of each shard are moved to their own range.
+SHARD_INVOICE_ID_STEP = 1 << 40
+
+# Returns conditions for rows of the table of a single shard
+TableFilter = Callable[[TableClause], Sequence[ColumnElement]]
+
+
+def get_sharded_models(
+    shard_schemas: Sequence[str],
+    customers_filter: Optional[TableFilter] = None,
+    invoices_filter: Optional[TableFilter] = None
+) -> Tuple[type, type]:
+    """Returns Customer and Invoice entities which read rows of all database shards.
+
+    Invoices of all shards are combined with UNION ALL. Customers are combined the
+     same way and deduplicated by id, since a customer may be present in several
+     shards. If there are no shards, the models themselves are returned and the
+     filters are not applied.
+
+    Filters are applied to every part of the union, so that each shard can use its
+     indexes and only matching rows are combined. Otherwise every query reads
+     whole tables of all shards.
+
+    :param shard_schemas: Names of attached shards databases
+    :param customers_filter: Conditions for Customer rows of each shard
+    :param invoices_filter: Conditions for Invoice rows of each shard
+    :return: Customer and Invoice entities, which can be used in queries instead of
+              the models
+    """
+
+    if not shard_schemas:
+        return Customer, Invoice
+
+    customers = union_all(
+        *[
+            _select_filtered(customers_table, customers_filter)
+            for customers_table in get_shard_tables(Customer.__table__, shard_schemas)
+        ]
+    ).subquery()
+    customers = (
+        select(customers)
+        .group_by(customers.c.CustomerId)
+        .subquery("all_customers")
+    )
+
+    invoices = union_all(
+        *[
+            _select_filtered(invoices_table, invoices_filter).with_only_columns(
+                *[
+                    (literal(number * SHARD_INVOICE_ID_STEP) + table_column).label("InvoiceId")
+                    if number and table_column.name == Invoice.InvoiceId.key else table_column
+                    for table_column in invoices_table.c
+                ]
+            )
+            for number, invoices_table in enumerate(
+                get_shard_tables(Invoice.__table__, shard_schemas)
+            )
+        ]
+    ).subquery("all_invoices")
+
+    return (
+        aliased(Customer, customers, name=Customer.__name__),
+        aliased(Invoice, invoices, name=Invoice.__name__),
+    )
+
+
+def get_shard_tables(model_table: Table, shard_schemas: Sequence[str]) -> List[TableClause]:
+    """The table of the main database followed by the same tables of the shards."""
+
+    return [
+        model_table,
+        *[
+            table(
+                model_table.name,
+                *[column(table_column.name, table_column.type) for table_column in model_table.c],
+                schema=schema
+            )
+            for schema in shard_schemas
+        ]
+    ]
+
+
+def _select_filtered(shard_table, table_filter: Optional[TableFilter]):
+    query = select(shard_table)
+    if table_filter:
+        query = query.where(*table_filter(shard_table))
+
+    return query
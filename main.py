@@ -2,18 +2,35 @@ import argparse
 import logging
 import os
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Type
 
 from db.meta import Session
 from services.customer_payments_data_service import CustomerPaymentsDataService
-from validators.argpargse_serializers import date_serializer
+from services.export_checkpoint import CheckpointError, FsyncPolicy
+from services.reports import BaseReport, REPORTS
+from services.table_writers import OutputFormat
+from validators.argpargse_serializers import (
+    date_serializer,
+    output_format_serializer,
+    reports_serializer,
+)
 from validators.input_validators import is_valid_date_range
 
 logging.basicConfig(format="%(filename)s: %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
 
 
-def main(start_date: Optional[datetime], end_date: Optional[datetime], path: str):
+def main(
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    path: str,
+    report_classes: List[Type[BaseReport]],
+    explain: bool = False,
+    with_index: bool = False,
+    resume: bool = False,
+    fsync_policy: FsyncPolicy = FsyncPolicy.FINAL,
+    output_format: OutputFormat = OutputFormat.JSON
+):
     if (
         start_date and end_date
         and not is_valid_date_range(start_date=start_date, end_date=end_date)
@@ -22,11 +39,27 @@ def main(start_date: Optional[datetime], end_date: Optional[datetime], path: str
         return
 
     with Session() as session:
-        CustomerPaymentsDataService(session).load_customers_payment_data_to_json(
-            start_date=start_date,
-            end_date=end_date,
-            path=path
-        )
+        service = CustomerPaymentsDataService(session)
+        plan = service.plan_export(start_date=start_date, end_date=end_date, explain=explain)
+
+        if explain:
+            print(plan.explain())
+            return
+
+        try:
+            service.generate_reports(
+                report_classes=report_classes,
+                start_date=start_date,
+                end_date=end_date,
+                path=path,
+                plan=plan,
+                with_index=with_index,
+                resume=resume,
+                fsync_policy=fsync_policy,
+                output_format=output_format
+            )
+        except (CheckpointError, ValueError) as err:
+            logger.error(str(err))
 
 
 def _get_input_args() -> argparse.Namespace:
@@ -50,6 +83,50 @@ def _get_input_args() -> argparse.Namespace:
              "in the script folder.",
         default=os.path.join(os.getcwd(), "output")
     )
+    parser.add_argument(
+        "-r", "--reports",
+        help="Comma separated names of reports to build in one pass over invoices. "
+             f"Available reports: {', '.join(sorted(REPORTS))}. "
+             "By default only 'customer_payments' report is built.",
+        type=reports_serializer,
+        default="customer_payments"
+    )
+    parser.add_argument(
+        "-f", "--format",
+        help="Format of output files: 'json', 'csv' or 'parquet' (requires pyarrow). "
+             "In 'csv' and 'parquet' formats customer payments are written as two "
+             "tables: customers and payments. Other reports are always written as JSON.",
+        type=output_format_serializer,
+        default=OutputFormat.JSON
+    )
+    parser.add_argument(
+        "--explain",
+        help="Print the chosen execution plan with predicted row counts and output "
+             "size without running the export.",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--index",
+        help="Write sidecar '.idx' file next to each report with one item per customer. "
+             "It allows to read single customers with services.export_index.ExportReader "
+             "without parsing the whole file. Can be used only with 'json' format.",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--resume",
+        help="Continue the interrupted export from its last checkpoint. "
+             "The same arguments as in the interrupted run have to be passed.",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--fsync",
+        help="When written data is synced to the disk: 'none' - never, "
+             "'final' - once before output files are renamed into place, "
+             "'always' - also on every checkpoint. Default is 'final'.",
+        type=FsyncPolicy,
+        choices=[policy.value for policy in FsyncPolicy],
+        default=FsyncPolicy.FINAL
+    )
 
     return parser.parse_args()
 
@@ -57,4 +134,14 @@ def _get_input_args() -> argparse.Namespace:
 if __name__ == "__main__":
     args = _get_input_args()
 
-    main(start_date=args.start, end_date=args.end, path=args.path)
+    main(
+        start_date=args.start,
+        end_date=args.end,
+        path=args.path,
+        report_classes=args.reports,
+        explain=args.explain,
+        with_index=args.index,
+        resume=args.resume,
+        fsync_policy=args.fsync,
+        output_format=args.format
+    )
@@ -1,26 +1,50 @@
 import os
+from contextlib import ExitStack
 from datetime import datetime
-from typing import Generator, List, Optional
+from typing import Generator, List, Optional, Sequence, Tuple, Type
+from uuid import uuid4
 
-import simplejson
-from sqlalchemy import desc
+from sqlalchemy import Column, desc, insert, Integer, MetaData, select, Table
 from sqlalchemy.engine import Row
-from sqlalchemy.orm import contains_eager, Session
-from sqlalchemy.sql import func
+from sqlalchemy.orm import contains_eager, Query, Session
+from sqlalchemy.sql import ColumnElement, func, TableClause
+from sqlalchemy.sql.elements import UnaryExpression
+from sqlalchemy.sql.operators import custom_op
 from sqlalchemy.sql.selectable import Subquery
 
-from db.models import Invoice, Customer
+from db.meta import SHARD_SCHEMAS
+from db.models import get_sharded_models, Invoice
+from services.export_checkpoint import (
+    CHECKPOINT_FILE_NAME,
+    CheckpointError,
+    ExportCheckpoint,
+    FsyncPolicy,
+    fsync_directory,
+    get_db_fingerprint,
+    get_part_file_path,
+)
+from services.export_planner import ExportPlan, ExportPlanner, ExportStrategy
+from services.reports import (
+    BaseReport,
+    CustomerPaymentsReport,
+    DEFAULT_CHUNK_SIZE,
+    iter_json_array_chunks,
+)
+from services.table_writers import OutputFormat
+from services.serializers import customer_payment_data_to_dict
 
 
 class CustomerPaymentsDataService:
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, shard_schemas: Sequence[str] = SHARD_SCHEMAS):
         self._session = session
+        self._shard_schemas = tuple(shard_schemas)
 
     def load_customers_payment_data_to_json(
         self,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-        path: str = None
+        path: str = None,
+        with_index: bool = False
     ) -> None:
         """Creates JSON file with customers with the list of their invoices.
 
@@ -32,22 +56,318 @@ class CustomerPaymentsDataService:
         :param end_date: Select only invoices billed earlier than <end_date>.
                           If None, parameter will be ignored without adding a filter.
         :param path: Path to directory where output file will be saved
+        :param with_index: Write sidecar index next to the output file.
+                            See ExportReader for random access to such files.
         :return: None
         """
-        data = self._get_data_generator(start_date, end_date)
-        file_path = self._get_file_path(path)
+        self.generate_reports(
+            report_classes=[CustomerPaymentsReport],
+            start_date=start_date,
+            end_date=end_date,
+            path=path,
+            with_index=with_index
+        )
+
+    def iter_customers_payment_data(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        plan: Optional[ExportPlan] = None
+    ) -> Generator[dict, None, None]:
+        """Lazily yields customers with the list of their invoices.
+
+        Items have the same format and order as in the `customer_payments` report.
+         Batches are retrieved only when the previous one is consumed, so a slow
+         consumer does not make the data pile up in memory. Closing the generator
+         releases temporary database objects of the export.
+
+        :param start_date: Select only invoices billed at <start_date> or later.
+                            If None, parameter will be ignored without adding a filter.
+        :param end_date: Select only invoices billed earlier than <end_date>.
+                          If None, parameter will be ignored without adding a filter.
+        :param plan: The way the data should be retrieved. If None, the plan will be
+                      chosen by ExportPlanner.
+        :return: Generator returning JSON serializable dictionaries.
+                  See customer_payment_data_to_dict for the format.
+        """
+        plan = plan or self.plan_export(start_date, end_date)
+
+        yield from self._get_data_generator(
+            start_date=start_date,
+            end_date=end_date,
+            batch_size=plan.batch_size,
+            strategy=plan.strategy,
+            use_date_index=plan.use_date_index
+        )
+
+    def iter_customers_payment_data_json(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        plan: Optional[ExportPlan] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Generator[bytes, None, None]:
+        """Same as iter_customers_payment_data, but yields the encoded JSON array.
+
+        Joined chunks are equal to the content of the `customer_payments` report file.
+
+        :param chunk_size: Minimal size of a chunk in bytes, only the last one can be
+                            smaller. A chunk exceeds it by less than one item.
+        :return: Generator returning UTF-8 encoded chunks of the JSON array
+        """
+
+        yield from iter_json_array_chunks(
+            self.iter_customers_payment_data(start_date, end_date, plan), chunk_size
+        )
+
+    def generate_reports(
+        self,
+        report_classes: Sequence[Type[BaseReport]],
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        path: str = None,
+        plan: Optional[ExportPlan] = None,
+        with_index: bool = False,
+        resume: bool = False,
+        checkpoint_interval: int = 10000,
+        fsync_policy: FsyncPolicy = FsyncPolicy.FINAL,
+        output_format: OutputFormat = OutputFormat.JSON
+    ) -> None:
+        """Creates output file for each of passed reports scanning invoices only once.
+
+        All reports consume the same stream of customers data rows ordered by
+         `total_paid` in descending order. See BaseReport for the row format.
+
+        Files are written under temporary ".part" names and renamed to the final
+         ones only when all reports are complete. The progress is saved to the
+         checkpoint file in the output directory, so an interrupted export can be
+         continued with `resume=True` and the same parameters.
+
+        :param report_classes: Registered BaseReport subclasses to build
+        :param start_date: Select only invoices billed at <start_date> or later.
+                            If None, parameter will be ignored without adding a filter.
+        :param end_date: Select only invoices billed earlier than <end_date>.
+                          If None, parameter will be ignored without adding a filter.
+        :param path: Path to directory where output files will be saved
+        :param plan: The way the data should be retrieved. If None, the plan will be
+                      chosen by ExportPlanner.
+        :param with_index: Write sidecar index for reports with one item per customer.
+                            See ExportReader for random access to such files.
+        :param resume: Continue the interrupted export from its last checkpoint.
+                        CheckpointError is raised if it is not possible. If False,
+                        CheckpointError is raised when the directory has an
+                        unfinished export.
+        :param checkpoint_interval: Number of customers between checkpoints
+        :param fsync_policy: When written data has to be synced to the disk
+        :param output_format: Format of reports files. Reports which do not support
+                               it are written as JSON. ValueError is raised if the
+                               sidecar index can not be written in it.
+        :return: None
+        """
+        plan = plan or self.plan_export(start_date, end_date)
+        reports = [
+            report_class.create(with_index=with_index, output_format=output_format)
+            for report_class in report_classes
+        ]
+        checkpoint_path = os.path.join(path, CHECKPOINT_FILE_NAME)
+        params = {
+            "start_date": start_date and start_date.isoformat(),
+            "end_date": end_date and end_date.isoformat(),
+            "reports": [report.name for report in reports],
+            "with_index": with_index,
+            "output_format": output_format.value,
+        }
+        db_fingerprint = get_db_fingerprint(self._session)
+
+        if resume:
+            checkpoint = ExportCheckpoint.load(checkpoint_path)
+            checkpoint.validate(params, db_fingerprint)
+            self._check_part_files(checkpoint, reports, checkpoint_path)
+        else:
+            if os.path.exists(checkpoint_path):
+                # the directory has one checkpoint, a new export would remove it
+                raise CheckpointError(
+                    f"There is an unfinished export in {path}. Continue it with "
+                    f"--resume or remove {checkpoint_path} to start a new one."
+                )
+
+            os.makedirs(path, exist_ok=True)
+            checkpoint = ExportCheckpoint(
+                params=params,
+                db_fingerprint=db_fingerprint,
+                file_paths=[
+                    self._get_file_path(path, report=report) for report in reports
+                ],
+                report_states=[None] * len(reports)
+            )
+
+        with ExitStack() as stack:
+            for report, file_path, state in zip(
+                reports, checkpoint.file_paths, checkpoint.report_states
+            ):
+                report.open(
+                    [get_part_file_path(path) for path in report.get_file_paths(file_path)],
+                    state
+                )
+                stack.callback(report.close)
+
+            data_rows = self._get_data_rows_generator(
+                start_date=start_date,
+                end_date=end_date,
+                batch_size=plan.batch_size,
+                strategy=plan.strategy,
+                use_date_index=plan.use_date_index,
+                skip=checkpoint.cursor
+            )
+            for data_row in data_rows:
+                for report in reports:
+                    report.consume(data_row)
 
-        os.makedirs(path, exist_ok=True)
-        with open(file_path, "w") as file:
-            simplejson.dump(data, file, iterable_as_array=True, indent=True)
+                checkpoint.cursor += 1
+                if checkpoint.cursor % checkpoint_interval == 0:
+                    self._save_checkpoint(checkpoint, checkpoint_path, reports, fsync_policy)
+
+            for report in reports:
+                report.finish()
+                report.flush(fsync=fsync_policy != FsyncPolicy.NONE)
+
+        for report, file_path in zip(reports, checkpoint.file_paths):
+            for final_file_path in report.get_file_paths(file_path):
+                os.replace(get_part_file_path(final_file_path), final_file_path)
+
+        if fsync_policy != FsyncPolicy.NONE:
+            fsync_directory(path)
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    @staticmethod
+    def _check_part_files(
+        checkpoint: ExportCheckpoint,
+        reports: Sequence[BaseReport],
+        checkpoint_path: str
+    ) -> None:
+        """Make sure unfinished files of the checkpointed export are still there.
+
+        Files are renamed only after all reports are finished, so a renamed file
+         means the export was interrupted after it had been completed.
+        """
+
+        for report, file_path in zip(reports, checkpoint.file_paths):
+            for final_file_path in report.get_file_paths(file_path):
+                part_file_path = get_part_file_path(final_file_path)
+                if os.path.exists(part_file_path):
+                    continue
+
+                if os.path.exists(final_file_path):
+                    raise CheckpointError(
+                        f"The export is already complete: {final_file_path} exists. "
+                        f"Remove {checkpoint_path} and finish renaming of remaining "
+                        "'.part' files, if there are any."
+                    )
+                raise CheckpointError(
+                    f"The export can not be resumed: {part_file_path} not found."
+                )
+
+    @staticmethod
+    def _save_checkpoint(
+        checkpoint: ExportCheckpoint,
+        checkpoint_path: str,
+        reports: Sequence[BaseReport],
+        fsync_policy: FsyncPolicy
+    ) -> None:
+        """Save progress of reports. Their files are flushed first, so that the
+         checkpoint never points beyond the data written to them."""
+
+        fsync = fsync_policy == FsyncPolicy.ALWAYS
+        for report in reports:
+            report.flush(fsync=fsync)
+
+        checkpoint.report_states = [report.get_state() for report in reports]
+        checkpoint.save(checkpoint_path, fsync=fsync)
+
+    def plan_export(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        explain: bool = False
+    ) -> ExportPlan:
+        """Choose the execution strategy and batch size for the export.
+
+        :param start_date: Select only invoices billed at <start_date> or later.
+                            If None, parameter will be ignored without adding a filter.
+        :param end_date: Select only invoices billed earlier than <end_date>.
+                          If None, parameter will be ignored without adding a filter.
+        :param explain: If True, EXPLAIN QUERY PLAN output of the main query of the
+                         chosen strategy is added to the plan.
+        :return: ExportPlan instance
+        """
+        planner = ExportPlanner(self._session, self._shard_schemas)
+        plan = planner.plan(start_date, end_date)
+
+        if explain:
+            if plan.strategy == ExportStrategy.RANKED_TEMP_TABLE:
+                queryset = self._get_ranking_query(
+                    start_date=start_date,
+                    end_date=end_date,
+                    use_date_index=plan.use_date_index
+                )
+            else:
+                queryset = self._get_customers_data_query(
+                    self._get_customers_subquery(
+                        start_date=start_date,
+                        end_date=end_date,
+                        batch_size=plan.batch_size,
+                        offset=0,
+                        use_date_index=plan.use_date_index
+                    ),
+                    start_date=start_date,
+                    end_date=end_date,
+                    use_date_index=plan.use_date_index
+                )
+            plan.query_plan = planner.explain_query(queryset.statement)
+
+        return plan
 
     def _get_data_generator(
         self,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-        batch_size: int = 10000
+        batch_size: int = 10000,
+        strategy: ExportStrategy = ExportStrategy.OFFSET_BATCHES,
+        use_date_index: bool = True
     ) -> Generator[dict, None, None]:
-        """Returns the results of _get_customers_data method as a generator.
+        """Returns the results of _get_data_rows_generator method as dictionaries.
+
+        :param start_date: start_date parameter for a _get_data_rows_generator method.
+        :param end_date: end_date parameter for a _get_data_rows_generator method.
+        :param batch_size: batch_size parameter for a _get_data_rows_generator method.
+        :param strategy: strategy parameter for a _get_data_rows_generator method.
+        :param use_date_index: use_date_index parameter for a _get_data_rows_generator
+                                method.
+        :return: Generator returning JSON serializable dictionaries.
+                  See customer_payment_data_to_dict for the format.
+        """
+        data_rows = self._get_data_rows_generator(
+            start_date=start_date,
+            end_date=end_date,
+            batch_size=batch_size,
+            strategy=strategy,
+            use_date_index=use_date_index
+        )
+        for data_row in data_rows:
+            yield customer_payment_data_to_dict(data_row)
+
+    def _get_data_rows_generator(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        batch_size: int = 10000,
+        strategy: ExportStrategy = ExportStrategy.OFFSET_BATCHES,
+        use_date_index: bool = True,
+        skip: int = 0
+    ) -> Generator[Row, None, None]:
+        """Returns customers data rows ordered by `total_paid` as a generator.
 
         The method is created by optimization reasons.
         It allows to avoid memory overflow and db connection timeouts by retrieving
@@ -59,34 +379,156 @@ class CustomerPaymentsDataService:
         :param end_date: end_date parameter for a _get_customers_data method.
                           Passing directly.
         :param batch_size: number of instances in one batch.
+        :param strategy: the way batches are retrieved. See ExportStrategy.
+        :param use_date_index: if False, the date filter is written so that SQLite
+                                does not use an index on Invoice.InvoiceDate.
+        :param skip: number of first rows to skip. Customers with equal totals are
+                      ordered by id, so the order is the same on every call.
         :return: Generator returning SQLAlchemy Row instances that contains two fields:
                    Customer - instance of Customer model with appropriate data
                    total_paid - Decimal value. Sum of selected invoices
         """
-        offset = 0
+        if strategy == ExportStrategy.RANKED_TEMP_TABLE:
+            yield from self._get_ranked_data_rows_generator(
+                start_date=start_date,
+                end_date=end_date,
+                batch_size=batch_size,
+                use_date_index=use_date_index,
+                skip=skip
+            )
+            return
+
+        offset = skip
 
         while True:
             customers_data = self._get_customers_data(
                 start_date=start_date,
                 end_date=end_date,
                 batch_size=batch_size,
-                offset=offset
+                offset=offset,
+                use_date_index=use_date_index
             )
 
             if not customers_data:
                 return
 
-            for data_row in customers_data:
-                yield self._data_row_to_dict(data_row)
+            yield from customers_data
 
             offset += batch_size
 
+    def _get_ranked_data_rows_generator(
+        self,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        batch_size: int,
+        use_date_index: bool,
+        skip: int = 0
+    ) -> Generator[Row, None, None]:
+        """Same as _get_data_rows_generator, but the totals are calculated only once.
+
+        Customers totals with their ranks are stored to a temporary table which is
+         dropped when the generator is exhausted or closed.
+        Each batch is a range of ranks, so its cost does not depend on the number
+         of already retrieved batches.
+        """
+        ranking_table = self._create_customers_ranking_table(
+            start_date=start_date,
+            end_date=end_date,
+            use_date_index=use_date_index
+        )
+
+        try:
+            last_rank = skip
+
+            while True:
+                customers_data = self._get_customers_data_query(
+                    ranking_table.select()
+                    .where(ranking_table.c.rank > last_rank)
+                    .where(ranking_table.c.rank <= last_rank + batch_size)
+                    .subquery(),
+                    start_date=start_date,
+                    end_date=end_date,
+                    use_date_index=use_date_index
+                ).all()
+
+                if not customers_data:
+                    return
+
+                yield from customers_data
+
+                last_rank += batch_size
+        finally:
+            ranking_table.drop(self._session.connection())
+
+    def _create_customers_ranking_table(
+        self,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        use_date_index: bool
+    ) -> Table:
+        """Creates temporary table filled with customers totals and their ranks.
+
+        :return: Table containing three fields:
+                   rank - position of a customer in the `total_paid` descending order,
+                           starting from 1
+                   CustomerId - id of a customer
+                   total_paid - total amount of invoices for appropriate customer
+        """
+
+        ranking_table = Table(
+            f"customer_ranking_{uuid4().hex}",
+            MetaData(),
+            Column("rank", Integer, primary_key=True),
+            Column("CustomerId", Integer, nullable=False),
+            Column("total_paid", Invoice.Total.type),
+            prefixes=["TEMPORARY"],
+        )
+        ranking_table.create(self._session.connection())
+
+        # Core INSERT does not trigger autoflush unlike ORM queries
+        self._session.flush()
+
+        self._session.execute(
+            insert(ranking_table).from_select(
+                ["rank", "CustomerId", "total_paid"],
+                self._get_ranking_query(start_date, end_date, use_date_index).statement
+            )
+        )
+
+        return ranking_table
+
+    def _get_ranking_query(
+        self,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        use_date_index: bool
+    ) -> Query:
+        """Generate query that calculates customers totals along with their ranks."""
+
+        customer, invoice = self._get_models(start_date, end_date, use_date_index)
+        totals_queryset = self._get_customers_totals_query(
+            customer,
+            invoice,
+            start_date=start_date,
+            end_date=end_date,
+            use_date_index=use_date_index
+        )
+
+        return totals_queryset.with_entities(
+            func.row_number().over(
+                order_by=(desc(func.sum(invoice.Total)), customer.CustomerId)
+            ).label("rank"),
+            customer.CustomerId,
+            func.sum(invoice.Total).label("total_paid")
+        )
+
     def _get_customers_data(
         self,
         start_date: Optional[datetime],
         end_date: Optional[datetime],
         batch_size: int,
-        offset: int
+        offset: int,
+        use_date_index: bool = True
     ) -> List[Row]:
         """Retrieves customers with the list of their invoices.
 
@@ -99,6 +541,7 @@ class CustomerPaymentsDataService:
                           If None, parameter will be ignored without adding a filter.
         :param batch_size: SQL limit param
         :param offset: SQL offset param
+        :param use_date_index: Allow SQLite to use an index on Invoice.InvoiceDate
         :return: List of SQLAlchemy Row instances that contains two fields:
                            Customer - instance of Customer model with appropriate data
                            total_paid - Decimal value. Sum of selected invoices
@@ -108,33 +551,75 @@ class CustomerPaymentsDataService:
             start_date=start_date,
             end_date=end_date,
             batch_size=batch_size,
-            offset=offset
+            offset=offset,
+            use_date_index=use_date_index
+        )
+
+        return self._get_customers_data_query(
+            customers_subquery,
+            start_date=start_date,
+            end_date=end_date,
+            use_date_index=use_date_index
+        ).all()
+
+    def _get_customers_data_query(
+        self,
+        customers_subquery: Subquery,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        use_date_index: bool
+    ) -> Query:
+        """Generate query joining customers and their invoices to customers totals.
+
+        :param customers_subquery: Subquery containing at least two fields:
+                                     CustomerId - id of a customer
+                                     total_paid - total amount of invoices
+                                   If `rank` field is present, rows are ordered by it,
+                                    otherwise by `total_paid` and CustomerId.
+        :return: Query returning the rows described in _get_customers_data
+        """
+
+        # Customers of a ranked batch are read from a small range of the ranking
+        # table, so each shard looks up only their rows. Totals of OFFSET batches are
+        # calculated by the subquery itself, repeating it for every shard would
+        # multiply its cost.
+        customer, invoice = self._get_models(
+            start_date,
+            end_date,
+            use_date_index,
+            customers_subquery if "rank" in customers_subquery.c else None
         )
 
         queryset = (
-            self._session.query(Customer)
-            .join(customers_subquery, customers_subquery.c.CustomerId == Customer.CustomerId)
-            .join(Customer.invoice_collection)
-            .options(contains_eager(Customer.invoice_collection))
+            self._session.query(customer)
+            .join(customers_subquery, customers_subquery.c.CustomerId == customer.CustomerId)
+            .join(customer.invoice_collection.of_type(invoice))
+            .options(contains_eager(customer.invoice_collection.of_type(invoice)))
             .with_entities(
-                Customer,
+                customer,
                 customers_subquery.c.total_paid
             )
         )
 
-        if start_date:
-            queryset = queryset.where(Invoice.InvoiceDate >= start_date)
-        if end_date:
-            queryset = queryset.where(Invoice.InvoiceDate < end_date)
+        if "rank" in customers_subquery.c:
+            queryset = queryset.order_by(customers_subquery.c.rank)
+        else:
+            queryset = queryset.order_by(
+                desc(customers_subquery.c.total_paid), customers_subquery.c.CustomerId
+            )
+        queryset = queryset.order_by(invoice.InvoiceId)
 
-        return queryset.all()
+        return self._filter_by_invoice_date(
+            queryset, invoice, start_date, end_date, use_date_index
+        )
 
     def _get_customers_subquery(
         self,
         start_date: Optional[datetime],
         end_date: Optional[datetime],
         batch_size: int,
-        offset: int
+        offset: int,
+        use_date_index: bool = True
     ) -> Subquery:
         """Generate subquery that calculates total amount of invoices for each customer.
 
@@ -144,82 +629,170 @@ class CustomerPaymentsDataService:
                           If None, parameter will be ignored without adding a filter.
         :param batch_size: SQL limit param
         :param offset: SQL offset param
+        :param use_date_index: Allow SQLite to use an index on Invoice.InvoiceDate
         :return: Subquery containing two fields:
                    CustomerId - id of a customer
                    total_paid - total amount of invoices for appropriate customer
         """
 
+        customer, invoice = self._get_models(start_date, end_date, use_date_index)
+
+        return (
+            self._get_customers_totals_query(
+                customer, invoice, start_date, end_date, use_date_index
+            )
+            .order_by(desc("total_paid"), customer.CustomerId)
+            .limit(batch_size).offset(offset)
+            .subquery()
+        )
+
+    def _get_customers_totals_query(
+        self,
+        customer: type,
+        invoice: type,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        use_date_index: bool
+    ) -> Query:
+        """Generate unordered query that calculates total amount of invoices for each customer.
+
+        :param customer: Customer entity returned by _get_models
+        :param invoice: Invoice entity returned by _get_models
+        """
+
         base_queryset = (
-            self._session.query(Customer)
-            .join(Customer.invoice_collection)
-            .group_by(Customer.CustomerId)
+            self._session.query(customer)
+            .join(customer.invoice_collection.of_type(invoice))
+            .group_by(customer.CustomerId)
             .with_entities(
-                Customer.CustomerId,
-                func.sum(Invoice.Total).label("total_paid")
+                customer.CustomerId,
+                func.sum(invoice.Total).label("total_paid")
             )
-            .order_by(desc("total_paid"))
         )
 
-        if start_date:
-            base_queryset = base_queryset.where(Invoice.InvoiceDate >= start_date)
-        if end_date:
-            base_queryset = base_queryset.where(Invoice.InvoiceDate < end_date)
+        return self._filter_by_invoice_date(
+            base_queryset, invoice, start_date, end_date, use_date_index
+        )
 
-        return (
-            base_queryset
-            .limit(batch_size).offset(offset)
-            .subquery()
+    def _get_models(
+        self,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        use_date_index: bool,
+        customers_subquery: Optional[Subquery] = None
+    ) -> Tuple[type, type]:
+        """Customer and Invoice entities reading rows of all database shards.
+
+        The invoice date range and, if <customers_subquery> is passed, its customer
+         ids are applied to the tables of each shard, see get_sharded_models.
+
+        :param customers_subquery: Subquery with CustomerId field limiting customers
+                                    and invoices to read
+        :return: Customer and Invoice entities
+        """
+
+        def filter_customers(shard_table: TableClause) -> List[ColumnElement]:
+            if customers_subquery is None:
+                return []
+
+            return [shard_table.c.CustomerId.in_(select(customers_subquery.c.CustomerId))]
+
+        def filter_invoices(shard_table: TableClause) -> List[ColumnElement]:
+            return [
+                *filter_customers(shard_table),
+                *self._get_invoice_date_conditions(
+                    shard_table.c.InvoiceDate, start_date, end_date, use_date_index
+                ),
+            ]
+
+        return get_sharded_models(self._shard_schemas, filter_customers, filter_invoices)
+
+    def _filter_by_invoice_date(
+        self,
+        queryset: Query,
+        invoice: type,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        use_date_index: bool
+    ) -> Query:
+        """Add invoice date range conditions to the query.
+
+        :param invoice: Invoice entity of the query
+        """
+
+        return queryset.where(
+            *self._get_invoice_date_conditions(
+                invoice.InvoiceDate, start_date, end_date, use_date_index
+            )
         )
 
     @staticmethod
-    def _data_row_to_dict(data_row: Row) -> dict:
-        """Map data row of specific format to JSON serializable dictionary.
-    
-        :param data_row: SQLAlchemy Row instance that contains two fields:
-                           Customer - instance of Customer model with appropriate data
-                           total_paid - Decimal value. Sum of selected invoices
-        :return: JSON serializable dictionary
+    def _get_invoice_date_conditions(
+        invoice_date: ColumnElement,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        use_date_index: bool
+    ) -> List[ColumnElement]:
+        """Invoice date range conditions for the column.
+
+        Unary plus is a no-op for SQLite values, but it prevents the query planner
+         from using an index on the column. It is cheaper to scan the whole table
+         than to look up each row of a wide index range.
         """
 
-        return {
-            "customer_id": data_row.Customer.CustomerId,
-            "first_name": data_row.Customer.FirstName,
-            "last_name": data_row.Customer.LastName,
-            "total_paid": str(data_row.total_paid),
-            "individual_payments": [
-                {
-                    "date": str(invoice.InvoiceDate),
-                    "amount": str(invoice.Total)
+        if not use_date_index:
+            invoice_date = UnaryExpression(
+                invoice_date,
+                operator=custom_op("+"),
+                type_=invoice_date.type
+            )
 
-                } for invoice in data_row.Customer.invoice_collection
-            ]
-        }
+        conditions = []
+        if start_date:
+            conditions.append(invoice_date >= start_date)
+        if end_date:
+            conditions.append(invoice_date < end_date)
+
+        return conditions
 
-    def _get_file_path(self, path: str, copy: int = 0) -> str:
+    def _get_file_path(
+        self,
+        path: str,
+        copy: int = 0,
+        report: Optional[BaseReport] = None
+    ) -> str:
         """Generate file name for output file and join it to provided path.
 
-        The file name will be "customer_payments_data_<YYYY-MM-DD_HH-MM>.json"
-        where the value in triangle brackets is current UTC date and time in appropriate
-        format.
+        The file name will be "<file_prefix>_<YYYY-MM-DD_HH-MM>.<file_extension>"
+        where the prefix and the extension are taken from the report and the last
+        value in triangle brackets is current UTC date and time in appropriate format.
 
-        If file with the same name already exists the method will add "(1)" to file name.
+        If any file of the report with the same name or its unfinished ".part"
+        version already exists the method will add "(1)" to file name.
         If such a file also exists too, it will increment number in brackets until free
         name will be found.
 
         :param path: Path to directory where output file will be saved
         :param copy: Number, that should be added to file name. 0 value means
                       nothing will be added.
+        :param report: Report the file is generated for.
+                        If None, the name of `customer_payments` JSON report is used.
         :return: Path to output file
         """
 
-        file_name = f"customer_payments_data_{datetime.utcnow().strftime('%Y-%m-%d_%H-%M')}"
+        report = report or CustomerPaymentsReport()
+
+        file_name = f"{report.file_prefix}_{datetime.utcnow().strftime('%Y-%m-%d_%H-%M')}"
         if copy:
             file_name += f"({copy})"
-        file_name += ".json"
+        file_name += f".{report.file_extension}"
 
         file_path = os.path.join(path, file_name)
 
-        if os.path.exists(file_path):
-            return self._get_file_path(path, copy + 1)
+        if any(
+            os.path.exists(report_file_path) or os.path.exists(get_part_file_path(report_file_path))
+            for report_file_path in report.get_file_paths(file_path)
+        ):
+            return self._get_file_path(path, copy + 1, report)
 
         return file_path
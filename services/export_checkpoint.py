@@ -0,0 +1,118 @@
+import os
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from typing import List, Optional
+
+import simplejson
+from sqlalchemy.orm import Session
+
+__all__ = (
+    "CHECKPOINT_FILE_NAME",
+    "CheckpointError",
+    "ExportCheckpoint",
+    "FsyncPolicy",
+    "fsync_directory",
+    "get_db_fingerprint",
+    "get_part_file_path",
+)
+
+
+CHECKPOINT_FILE_NAME = ".export_checkpoint"
+
+
+class CheckpointError(Exception):
+    pass
+
+
+class FsyncPolicy(str, Enum):
+    # Rely on the OS to write data to the disk
+    NONE = "none"
+    # Sync output files and their directory once before the files are renamed
+    FINAL = "final"
+    # Also sync output files and the checkpoint file on each checkpoint
+    ALWAYS = "always"
+
+
+@dataclass
+class ExportCheckpoint:
+    """Progress of an export which allows to continue it after interruption.
+
+    :param params: Export parameters, the resumed export has to be started with
+                    the same ones
+    :param db_fingerprint: Result of get_db_fingerprint at the export start
+    :param file_paths: Final output file path of each report
+    :param cursor: Number of customers data rows consumed by all reports
+    :param report_states: Result of BaseReport.get_state for each report
+    """
+
+    params: dict
+    db_fingerprint: list
+    file_paths: List[str]
+    cursor: int = 0
+    report_states: List[Optional[dict]] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, file_path: str) -> "ExportCheckpoint":
+        if not os.path.exists(file_path):
+            raise CheckpointError(f"There is no export to resume: {file_path} not found.")
+
+        with open(file_path) as file:
+            return cls(**simplejson.load(file))
+
+    def save(self, file_path: str, fsync: bool = False) -> None:
+        """Replace the checkpoint file atomically, so it is never seen half-written."""
+
+        temp_file_path = f"{file_path}.tmp"
+        with open(temp_file_path, "w") as file:
+            simplejson.dump(asdict(self), file)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+
+        os.replace(temp_file_path, file_path)
+
+    def validate(self, params: dict, db_fingerprint: list) -> None:
+        if params != self.params:
+            raise CheckpointError(
+                "The export can not be resumed with different parameters. "
+                f"Checkpoint parameters: {self.params}."
+            )
+        if db_fingerprint != self.db_fingerprint:
+            raise CheckpointError(
+                "The export can not be resumed: the database was changed since its start."
+            )
+
+
+def get_db_fingerprint(session: Session) -> list:
+    """Identify state of database files the session is connected to.
+
+    Size and modification time of each attached database file are used, so any
+     write to the database makes the fingerprint different. In-memory databases
+     can not outlive the process, so they are not taken into account.
+    """
+
+    fingerprint = []
+    for _, name, file_path in session.connection().exec_driver_sql(
+        "PRAGMA database_list"
+    ).all():
+        if file_path and name != "temp":
+            stat = os.stat(file_path)
+            fingerprint.append([name, file_path, stat.st_size, stat.st_mtime_ns])
+
+    return fingerprint
+
+
+def get_part_file_path(file_path: str) -> str:
+    """Path the file is written to until the export is complete."""
+
+    return f"{file_path}.part"
+
+
+def fsync_directory(path: str) -> None:
+    """Make renames of files in the directory durable."""
+
+    file_descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(file_descriptor)
+    finally:
+        os.close(file_descriptor)
@@ -0,0 +1,201 @@
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import simplejson
+
+__all__ = (
+    "ExportIndexWriter",
+    "ExportReader",
+    "get_index_file_path",
+)
+
+
+# Sidecar index file layout, all numbers are little-endian:
+#   header:        magic, format version, number of items
+#   rank section:  (customer_id, offset, length) of every item in the order of
+#                   the export, so the entry of rank N is the N-th one
+#   id section:    (customer_id, rank) sorted by customer_id for binary search
+HEADER = struct.Struct("<4sHxxQ")
+RANK_ENTRY = struct.Struct("<qQI")
+ID_ENTRY = struct.Struct("<qQ")
+
+MAGIC = b"CPIX"
+VERSION = 1
+
+
+def get_index_file_path(file_path: str) -> str:
+    return f"{file_path}.idx"
+
+
+class ExportIndexWriter:
+    """Writes sidecar index of an export file item by item.
+
+    Rank entries are written as soon as items come, so nothing is kept in memory
+     while the export goes on. The id section is built from the rank section when
+     the index is closed with external merge sort: chunks of the rank section are
+     sorted into runs in a temporary file and the runs are merged, so memory usage
+     does not depend on the number of items.
+
+    To continue writing of an unfinished index, pass the file positioned at the end
+     of its rank section and the number of already written items.
+    """
+
+    # Number of entries sorted in memory at once
+    sort_chunk_size = 1 << 16
+    # Number of entries read from each run at once while merging
+    merge_block_size = 256
+
+    def __init__(self, file: BinaryIO, items_count: int = 0):
+        self._file = file
+        self._items_count = items_count
+
+    @property
+    def items_count(self) -> int:
+        return self._items_count
+
+    def open(self) -> None:
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0))
+
+    def write(self, customer_id: int, offset: int, length: int) -> None:
+        self._file.write(RANK_ENTRY.pack(customer_id, offset, length))
+        self._items_count += 1
+
+    def close(self) -> None:
+        self._file.flush()
+
+        with tempfile.TemporaryFile() as runs_file:
+            runs = self._write_sorted_runs(runs_file)
+
+            self._file.seek(HEADER.size + self._items_count * RANK_ENTRY.size)
+            for entry in heapq.merge(
+                *(self._iter_run(runs_file, *run) for run in runs)
+            ):
+                self._file.write(ID_ENTRY.pack(*entry))
+
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, self._items_count))
+        self._file.seek(0, os.SEEK_END)
+
+    def _write_sorted_runs(self, runs_file: BinaryIO) -> List[Tuple[int, int]]:
+        """Write (customer_id, rank) entries sorted within chunks of the rank section.
+
+        :return: Offset and number of entries of each run in <runs_file>
+        """
+
+        runs = []
+        for first_rank in range(1, self._items_count + 1, self.sort_chunk_size):
+            entries_count = min(self.sort_chunk_size, self._items_count - first_rank + 1)
+            self._file.seek(HEADER.size + (first_rank - 1) * RANK_ENTRY.size)
+            rank_entries = RANK_ENTRY.iter_unpack(
+                self._file.read(entries_count * RANK_ENTRY.size)
+            )
+
+            runs.append((runs_file.tell(), entries_count))
+            runs_file.write(b"".join(
+                ID_ENTRY.pack(customer_id, rank) for customer_id, rank in sorted(
+                    (entry[0], rank) for rank, entry in enumerate(rank_entries, first_rank)
+                )
+            ))
+
+        return runs
+
+    def _iter_run(
+        self,
+        runs_file: BinaryIO,
+        offset: int,
+        entries_count: int
+    ) -> Iterator[Tuple[int, int]]:
+        # runs share the file, so the position is set before every read
+        for first_entry in range(0, entries_count, self.merge_block_size):
+            runs_file.seek(offset + first_entry * ID_ENTRY.size)
+            yield from ID_ENTRY.iter_unpack(runs_file.read(
+                min(self.merge_block_size, entries_count - first_entry) * ID_ENTRY.size
+            ))
+
+
+class ExportReader:
+    """Random access to items of an export file written with the sidecar index.
+
+    Both files are memory mapped, so a lookup reads only a few index pages and
+     the bytes of the requested item instead of parsing the whole export.
+
+    Ranks start from 1 and follow the order of the export.
+    """
+
+    def __init__(self, file_path: str, index_path: Optional[str] = None):
+        index_path = index_path or get_index_file_path(file_path)
+
+        with open(file_path, "rb") as file:
+            self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(index_path, "rb") as file:
+            self._index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._items_count = HEADER.unpack_from(self._index, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Not a valid export index file: {index_path}.")
+
+        self._id_section_offset = HEADER.size + self._items_count * RANK_ENTRY.size
+
+    def __enter__(self) -> "ExportReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._items_count
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.get_rank_range(1, self._items_count)
+
+    def close(self) -> None:
+        self._data.close()
+        self._index.close()
+
+    def get_customer(self, customer_id: int) -> Optional[dict]:
+        """Find item of the customer using binary search over the id section.
+
+        :param customer_id: Id of a customer
+        :return: Item of the customer or None if the customer is not in the export
+        """
+
+        low, high = 0, self._items_count
+        while low < high:
+            middle = (low + high) // 2
+            middle_id, rank = ID_ENTRY.unpack_from(
+                self._index, self._id_section_offset + middle * ID_ENTRY.size
+            )
+            if middle_id == customer_id:
+                return self._read_item(*self._get_rank_entry(rank)[1:])
+            if middle_id < customer_id:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def get_rank(self, rank: int) -> dict:
+        if not 1 <= rank <= self._items_count:
+            raise IndexError(f"Rank {rank} is out of range 1..{self._items_count}.")
+
+        return self._read_item(*self._get_rank_entry(rank)[1:])
+
+    def get_rank_range(self, first_rank: int, last_rank: int) -> Iterator[dict]:
+        """Lazily yields items from <first_rank> to <last_rank> inclusive.
+
+        Ranks outside of the export are skipped.
+        """
+
+        for rank in range(max(first_rank, 1), min(last_rank, self._items_count) + 1):
+            yield self._read_item(*self._get_rank_entry(rank)[1:])
+
+    def _get_rank_entry(self, rank: int) -> Tuple[int, int, int]:
+        return RANK_ENTRY.unpack_from(self._index, HEADER.size + (rank - 1) * RANK_ENTRY.size)
+
+    def _read_item(self, offset: int, length: int) -> dict:
+        return simplejson.loads(self._data[offset:offset + length])
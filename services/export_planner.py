@@ -0,0 +1,245 @@
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from db.models import Customer, get_shard_tables, Invoice
+
+__all__ = (
+    "ExportPlan",
+    "ExportPlanner",
+    "ExportStrategy",
+)
+
+
+class ExportStrategy(str, Enum):
+    # Every batch re-runs the ranking aggregate and skips already returned rows
+    # with OFFSET. No setup cost, but the total cost grows quadratically with the
+    # number of batches.
+    OFFSET_BATCHES = "offset_batches"
+    # The ranking aggregate is computed once into a temporary table, batches are
+    # read from it by rank ranges.
+    RANKED_TEMP_TABLE = "ranked_temp_table"
+
+
+@dataclass
+class ExportPlan:
+    strategy: ExportStrategy
+    batch_size: int
+    use_date_index: bool
+    estimated_invoices: int
+    estimated_customers: int
+    estimated_output_bytes: int
+    query_plan: List[str] = field(default_factory=list)
+
+    def explain(self) -> str:
+        """Human readable description of the plan."""
+
+        lines = [
+            f"Strategy: {self.strategy.value}",
+            f"Batch size: {self.batch_size}",
+            f"Invoices date filter: {'index range' if self.use_date_index else 'full scan'}",
+            f"Estimated invoices: {self.estimated_invoices}",
+            f"Estimated customers: {self.estimated_customers}",
+            f"Estimated output size: {self.estimated_output_bytes} bytes",
+        ]
+        if self.query_plan:
+            lines.append("Query plan:")
+            lines.extend(f"  {line}" for line in self.query_plan)
+
+        return "\n".join(lines)
+
+
+class ExportPlanner:
+    """Picks the execution strategy of an export based on cheap estimates.
+
+    Table sizes are taken from `sqlite_stat1` (filled by ANALYZE) when it is
+     available, otherwise from the max rowid. Matching invoices are counted
+     directly only if the count can be answered by an index range on
+     Invoice.InvoiceDate, otherwise the same guess as SQLite query planner uses
+     is applied: each range bound selects 1/4 of rows.
+
+    If databases shards are attached, invoices counts are summed up across them,
+     customers are counted exactly, since the same customer may be present in
+     several shards, and the date index is considered only if every shard has it.
+    """
+
+    # Number of invoices which are loaded into memory at once in a single batch
+    target_batch_invoices = 50000
+    min_batch_size = 100
+    max_batch_size = 10000
+    # Share of matching invoices starting from which scanning the whole table is
+    # cheaper than reading the index range and looking up each row
+    max_index_range_selectivity = 0.5
+    # Average size of serialized data in the `customer_payments` report
+    customer_record_bytes = 130
+    payment_record_bytes = 60
+
+    def __init__(self, session: Session, shard_schemas: Sequence[str] = ()):
+        self._session = session
+        self._schemas = ["main", *shard_schemas]
+
+    def plan(
+        self,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ) -> ExportPlan:
+        """Estimate the size of export and choose how it should be executed.
+
+        :param start_date: Select only invoices billed at <start_date> or later.
+                            If None, parameter will be ignored without adding a filter.
+        :param end_date: Select only invoices billed earlier than <end_date>.
+                          If None, parameter will be ignored without adding a filter.
+        :return: ExportPlan instance without query plan
+        """
+
+        total_invoices = self._get_table_rows_count(Invoice.__table__.name)
+        total_customers = self._get_customers_count()
+        has_date_index = self._has_date_index()
+
+        if not (start_date or end_date):
+            estimated_invoices = total_invoices
+        elif has_date_index:
+            estimated_invoices = self._count_invoices(start_date, end_date)
+        else:
+            bounds_count = (start_date is not None) + (end_date is not None)
+            estimated_invoices = math.ceil(total_invoices / 4 ** bounds_count)
+
+        estimated_customers = self._estimate_distinct_customers(
+            total_customers, estimated_invoices
+        )
+        selectivity = estimated_invoices / total_invoices if total_invoices else 0
+        batch_size = self._get_batch_size(estimated_invoices, estimated_customers)
+
+        return ExportPlan(
+            strategy=(
+                ExportStrategy.OFFSET_BATCHES
+                if estimated_customers <= batch_size
+                else ExportStrategy.RANKED_TEMP_TABLE
+            ),
+            batch_size=batch_size,
+            use_date_index=(
+                has_date_index and selectivity <= self.max_index_range_selectivity
+            ),
+            estimated_invoices=estimated_invoices,
+            estimated_customers=estimated_customers,
+            estimated_output_bytes=(
+                estimated_customers * self.customer_record_bytes
+                + estimated_invoices * self.payment_record_bytes
+            ),
+        )
+
+    def explain_query(self, statement: Select) -> List[str]:
+        """Returns EXPLAIN QUERY PLAN output of the statement, one line per step.
+
+        :param statement: Statement to explain
+        :return: List of plan steps indented according to their nesting
+        """
+
+        compiled = statement.compile(
+            dialect=self._session.get_bind().dialect,
+            compile_kwargs={"literal_binds": True}
+        )
+        rows = self._session.connection().exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {compiled}"
+        ).all()
+
+        depths = {0: -1}
+        lines = []
+        for step_id, parent_id, _, detail in rows:
+            depths[step_id] = depths.get(parent_id, -1) + 1
+            lines.append(f"{'  ' * depths[step_id]}{detail}")
+
+        return lines
+
+    def _get_table_rows_count(self, table_name: str) -> int:
+        return sum(
+            self._get_shard_table_rows_count(schema, table_name) for schema in self._schemas
+        )
+
+    def _get_customers_count(self) -> int:
+        if len(self._schemas) == 1:
+            return self._get_table_rows_count(Customer.__table__.name)
+
+        # ids are read from the primary key of each shard, customers are much
+        # fewer than invoices
+        return self._session.connection().exec_driver_sql(
+            "SELECT COUNT(*) FROM ("
+            + " UNION ".join(
+                f'SELECT CustomerId FROM "{schema}"."{Customer.__table__.name}"'
+                for schema in self._schemas
+            )
+            + ")"
+        ).scalar()
+
+    def _get_shard_table_rows_count(self, schema: str, table_name: str) -> int:
+        connection = self._session.connection()
+        if connection.exec_driver_sql(
+            f'SELECT 1 FROM "{schema}".sqlite_master '
+            "WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).scalar():
+            stat = connection.exec_driver_sql(
+                f'SELECT stat FROM "{schema}".sqlite_stat1 WHERE tbl = ? LIMIT 1',
+                (table_name,)
+            ).scalar()
+            if stat:
+                return int(stat.split()[0])
+
+        # rowid is an alias of the integer primary key, so MAX() is a single lookup
+        return connection.exec_driver_sql(
+            f'SELECT COALESCE(MAX(rowid), 0) FROM "{schema}"."{table_name}"'
+        ).scalar()
+
+    def _has_date_index(self) -> bool:
+        return all(self._has_shard_date_index(schema) for schema in self._schemas)
+
+    def _has_shard_date_index(self, schema: str) -> bool:
+        connection = self._session.connection()
+        for index in connection.exec_driver_sql(
+            f'PRAGMA "{schema}".index_list("{Invoice.__table__.name}")'
+        ).all():
+            first_column = connection.exec_driver_sql(
+                f'PRAGMA "{schema}".index_info("{index.name}")'
+            ).first()
+            if first_column and first_column.name == Invoice.InvoiceDate.key:
+                return True
+
+        return False
+
+    def _count_invoices(
+        self,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime]
+    ) -> int:
+        # each shard is counted separately, so that it uses its own date index
+        invoices_count = 0
+        for invoices_table in get_shard_tables(Invoice.__table__, self._schemas[1:]):
+            queryset = select(func.count()).select_from(invoices_table)
+            if start_date:
+                queryset = queryset.where(invoices_table.c.InvoiceDate >= start_date)
+            if end_date:
+                queryset = queryset.where(invoices_table.c.InvoiceDate < end_date)
+
+            invoices_count += self._session.execute(queryset).scalar()
+
+        return invoices_count
+
+    @staticmethod
+    def _estimate_distinct_customers(total_customers: int, invoices: int) -> int:
+        """Expected number of distinct customers among invoices spread uniformly."""
+
+        if not total_customers or not invoices:
+            return 0
+
+        return math.ceil(total_customers * (1 - math.exp(-invoices / total_customers)))
+
+    def _get_batch_size(self, invoices: int, customers: int) -> int:
+        invoices_per_customer = invoices / customers if customers else 1
+        batch_size = int(self.target_batch_invoices / max(invoices_per_customer, 1))
+
+        return max(self.min_batch_size, min(self.max_batch_size, batch_size))
@@ -0,0 +1,216 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import (
+    AsyncIterator,
+    Callable,
+    Deque,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+from sqlalchemy.orm import Session
+
+from db.meta import SHARD_SCHEMAS
+from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.export_planner import ExportPlan
+from services.reports import DEFAULT_CHUNK_SIZE
+
+__all__ = (
+    "AsyncExportStream",
+    "aiter_customers_payment_data",
+    "aiter_customers_payment_data_json",
+)
+
+
+T = TypeVar("T")
+
+
+class AsyncExportStream(AsyncIterator[T]):
+    """Async iterator over a blocking iterator advanced in a dedicated thread.
+
+    The blocking iterator is created, advanced and closed in the same single
+     worker thread, so database connections opened by it never cross threads and
+     the event loop is never blocked by queries or encoding.
+
+    Items are read in batches of <prefetch> items and only one batch is read ahead
+     of the consumer. If the consumer is slow, reading stops until it catches up,
+     so no more than two batches are kept in memory.
+
+    The stream is closed when it is exhausted, when `aclose` is called or when
+     the `async with` block is left. Closing stops reading and closes the blocking
+     iterator, e.g. runs `finally` blocks of a generator. Cancellation of a task
+     waiting for the next item does not lose the batch being read, the stream
+     can still be continued or closed afterwards.
+
+    A stream which is dropped without closing, e.g. by a cancelled task iterating
+     it with bare `async for`, closes the blocking iterator when it is garbage
+     collected. It happens only after the running read is finished, since the read
+     keeps a reference to the stream.
+    """
+
+    def __init__(self, iterator_factory: Callable[[], Iterator[T]], prefetch: int = 100):
+        """
+        :param iterator_factory: Callable creating the blocking iterator. It is called
+                                  in the worker thread on the first read.
+        :param prefetch: Number of items read from the blocking iterator at once
+        """
+
+        self._iterator_factory = iterator_factory
+        self._prefetch = prefetch
+        self._iterator: Optional[Iterator[T]] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export-stream")
+        self._items: Deque[T] = deque()
+        self._pending_batch: Optional[asyncio.Future] = None
+        self._exhausted = False
+        self._closed = False
+
+    async def __aenter__(self) -> "AsyncExportStream[T]":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    def __aiter__(self) -> "AsyncExportStream[T]":
+        return self
+
+    async def __anext__(self) -> T:
+        while not self._items:
+            if self._closed:
+                raise StopAsyncIteration
+            if self._exhausted:
+                await self.aclose()
+                raise StopAsyncIteration
+
+            if self._pending_batch is None:
+                self._pending_batch = self._read_batch()
+
+            try:
+                # shielded, so a cancelled consumer does not cancel the read
+                batch = await asyncio.shield(self._pending_batch)
+            except Exception:
+                self._pending_batch = None
+                await self.aclose()
+                raise
+
+            self._pending_batch = None
+            self._items.extend(batch)
+            if len(batch) < self._prefetch:
+                self._exhausted = True
+            else:
+                self._pending_batch = self._read_batch()
+
+        return self._items.popleft()
+
+    async def aclose(self) -> None:
+        """Stop reading and close the blocking iterator in the worker thread."""
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self._items.clear()
+
+        if self._pending_batch is not None:
+            # a batch which is not started yet is dropped, the running one is
+            # finished first, because the worker thread can not be interrupted
+            self._pending_batch.cancel()
+            self._pending_batch = None
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._close_iterator
+            )
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def __del__(self) -> None:
+        if getattr(self, "_closed", True):
+            return
+
+        # no event loop is needed, the executor runs the close after pending reads
+        self._closed = True
+        self._executor.submit(self._close_iterator)
+        self._executor.shutdown(wait=False)
+
+    def _read_batch(self) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self._executor, self._next_batch)
+
+    def _next_batch(self) -> List[T]:
+        if self._iterator is None:
+            self._iterator = iter(self._iterator_factory())
+
+        return list(islice(self._iterator, self._prefetch))
+
+    def _close_iterator(self) -> None:
+        close = getattr(self._iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def aiter_customers_payment_data(
+    session_factory: Callable[[], Session],
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    plan: Optional[ExportPlan] = None,
+    shard_schemas: Sequence[str] = SHARD_SCHEMAS,
+    prefetch: int = 100
+) -> AsyncExportStream[dict]:
+    """Async version of CustomerPaymentsDataService.iter_customers_payment_data.
+
+    The stream opens its own session in the worker thread and closes it together
+     with the stream, so sessions of the caller are never used from another thread.
+
+    :param session_factory: Callable creating a new session, e.g. db.meta.Session
+    :param start_date: Select only invoices billed at <start_date> or later.
+                        If None, parameter will be ignored without adding a filter.
+    :param end_date: Select only invoices billed earlier than <end_date>.
+                      If None, parameter will be ignored without adding a filter.
+    :param plan: The way the data should be retrieved. If None, the plan will be
+                  chosen by ExportPlanner.
+    :param shard_schemas: Names of attached database shards
+    :param prefetch: Number of customers read ahead of the consumer
+    :return: AsyncExportStream returning JSON serializable dictionaries.
+              See customer_payment_data_to_dict for the format.
+    """
+
+    def iter_data() -> Iterator[dict]:
+        with session_factory() as session:
+            yield from CustomerPaymentsDataService(
+                session, shard_schemas
+            ).iter_customers_payment_data(start_date, end_date, plan)
+
+    return AsyncExportStream(iter_data, prefetch)
+
+
+def aiter_customers_payment_data_json(
+    session_factory: Callable[[], Session],
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    plan: Optional[ExportPlan] = None,
+    shard_schemas: Sequence[str] = SHARD_SCHEMAS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    prefetch: int = 2
+) -> AsyncExportStream[bytes]:
+    """Async version of CustomerPaymentsDataService.iter_customers_payment_data_json.
+
+    See aiter_customers_payment_data for the parameters.
+
+    :param chunk_size: Minimal size of a chunk in bytes, only the last one can be
+                        smaller
+    :param prefetch: Number of chunks read ahead of the consumer
+    :return: AsyncExportStream returning UTF-8 encoded chunks of the JSON array
+    """
+
+    def iter_chunks() -> Iterator[bytes]:
+        with session_factory() as session:
+            yield from CustomerPaymentsDataService(
+                session, shard_schemas
+            ).iter_customers_payment_data_json(start_date, end_date, plan, chunk_size)
+
+    return AsyncExportStream(iter_chunks, prefetch)
@@ -0,0 +1,476 @@
+import io
+import os
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from decimal import Decimal
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+import simplejson
+from sqlalchemy.engine import Row
+
+from services.export_index import ExportIndexWriter, get_index_file_path
+from services.export_checkpoint import CheckpointError
+from services.serializers import customer_payment_data_to_dict
+from services.table_writers import get_table_writer_class, OutputFormat
+
+__all__ = (
+    "BaseReport",
+    "CountryRevenueReport",
+    "CustomerPaymentsReport",
+    "CustomerPaymentsTablesReport",
+    "DEFAULT_CHUNK_SIZE",
+    "JsonArrayWriter",
+    "PurchaseDatesReport",
+    "REPORTS",
+    "SupportRepTotalsReport",
+    "get_report_classes",
+    "iter_json_array_chunks",
+    "register_report",
+)
+
+
+REPORTS: Dict[str, Type["BaseReport"]] = {}
+
+
+def register_report(report_class: Type["BaseReport"]) -> Type["BaseReport"]:
+    """Class decorator that makes report available by its name.
+
+    :param report_class: BaseReport subclass with unique `name` attribute
+    :return: The same class
+    """
+
+    if report_class.name in REPORTS:
+        raise ValueError(f"Report '{report_class.name}' is already registered.")
+
+    REPORTS[report_class.name] = report_class
+    return report_class
+
+
+def get_report_classes(names: Iterable[str]) -> List[Type["BaseReport"]]:
+    """Find registered report classes by their names.
+
+    Duplicated names are ignored, the order of the first occurrence is kept.
+
+    :param names: Names of registered reports
+    :return: List of appropriate report classes
+    """
+
+    report_classes = []
+    for name in names:
+        if name not in REPORTS:
+            raise ValueError(
+                f"Unknown report: {name}. "
+                f"Available reports: {', '.join(sorted(REPORTS))}."
+            )
+        if REPORTS[name] not in report_classes:
+            report_classes.append(REPORTS[name])
+
+    return report_classes
+
+
+class JsonArrayWriter:
+    """Writes JSON array to a binary file item by item without keeping it in memory.
+
+    To continue writing of an unfinished array, pass the file positioned at its end
+     and the number of already written items.
+    """
+
+    def __init__(self, file: BinaryIO, items_count: int = 0):
+        self._file = file
+        self._items_count = items_count
+        self._position = file.tell()
+
+    @property
+    def items_count(self) -> int:
+        return self._items_count
+
+    def open(self) -> None:
+        self._write(b"[")
+
+    def write(self, item: dict) -> Tuple[int, int]:
+        """Append item to the array.
+
+        :param item: JSON serializable dictionary
+        :return: Offset of the item in the file and its length in bytes
+        """
+
+        self._write(b",\n" if self._items_count else b"\n")
+        offset = self._position
+        self._write(simplejson.dumps(item, indent=True).encode())
+        self._items_count += 1
+
+        return offset, self._position - offset
+
+    def close(self) -> None:
+        self._write(b"\n]" if self._items_count else b"]")
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._position += len(data)
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array_chunks(
+    items: Iterable[dict],
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Encode items as JSON array the same way JsonArrayWriter writes them to a file.
+
+    Items are encoded as soon as they come and returned in chunks of at least
+     <chunk_size> bytes (except the last one), so the array is never kept in memory.
+
+    :param items: JSON serializable dictionaries
+    :param chunk_size: Minimal size of a chunk in bytes
+    :return: Iterator returning UTF-8 encoded chunks of the array
+    """
+
+    buffer = io.BytesIO()
+    writer = JsonArrayWriter(buffer)
+    writer.open()
+
+    for item in items:
+        writer.write(item)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    writer.close()
+    yield buffer.getvalue()
+
+
+class BaseReport(ABC):
+    """Report built from the single ordered stream of customers data rows.
+
+    Every data row is SQLAlchemy Row instance that contains two fields:
+        Customer - instance of Customer model with eagerly loaded invoices
+                    matching the requested period
+        total_paid - Decimal value. Sum of selected invoices
+    Rows are ordered by `total_paid` in descending order.
+
+    If `with_index` is True, the report writes sidecar index next to its output
+     file, so that ExportReader can access its items. It is ignored by reports
+     which do not write one item per customer.
+
+    The state returned by `get_state` allows to continue the report in a new
+     process: output files are truncated to the saved positions and the rest of
+     the rows is consumed as usual.
+    """
+
+    name: str = None
+    file_prefix: str = None
+    file_extension: str = OutputFormat.JSON.value
+    buffer_size: int = io.DEFAULT_BUFFER_SIZE
+
+    def __init__(self, with_index: bool = False):
+        self.with_index = with_index
+        self._files: List[BinaryIO] = []
+
+    @classmethod
+    def create(
+        cls,
+        with_index: bool = False,
+        output_format: OutputFormat = OutputFormat.JSON
+    ) -> "BaseReport":
+        """Create report writing its data in the requested format.
+
+        Reports which do not support the format are written as JSON.
+        """
+
+        return cls(with_index=with_index)
+
+    def get_file_paths(self, file_path: str) -> List[str]:
+        """All files written by the report for the main output file path."""
+
+        return [file_path]
+
+    def open(self, file_paths: List[str], state: Optional[dict] = None) -> None:
+        """Called once before the first data row is consumed.
+
+        :param file_paths: Paths to write files of the report to, in the order of
+                            get_file_paths result
+        :param state: Result of get_state of the interrupted report to continue.
+                       If None, the report starts from scratch.
+        """
+
+        positions = state["positions"] if state else [None] * len(file_paths)
+
+        # without fsync on each checkpoint, the checkpoint can outlive data written
+        # before it, truncate would pad such file with zero bytes
+        for path, position in zip(file_paths, positions):
+            if position is not None and os.path.getsize(path) < position:
+                raise CheckpointError(
+                    f"The export can not be resumed: {path} is shorter than "
+                    "its checkpointed size."
+                )
+
+        for path, position in zip(file_paths, positions):
+            if position is None:
+                self._files.append(open(path, "w+b", buffering=self.buffer_size))
+            else:
+                file = open(path, "r+b", buffering=self.buffer_size)
+                self._files.append(file)
+                file.truncate(position)
+                file.seek(position)
+
+    @abstractmethod
+    def consume(self, data_row: Row) -> None:
+        """Process the next data row of the stream."""
+
+    def finish(self) -> None:
+        """Called once after the last data row is consumed."""
+
+    def get_state(self) -> dict:
+        """JSON serializable state of the report. Files have to be flushed before."""
+
+        return {"positions": [file.tell() for file in self._files]}
+
+    def flush(self, fsync: bool = False) -> None:
+        for file in self._files:
+            file.flush()
+            if fsync:
+                os.fsync(file.fileno())
+
+    def close(self) -> None:
+        """Release files of the report. Called even if the export failed."""
+
+        for file in self._files:
+            file.close()
+
+
+class StreamedJsonReport(BaseReport, ABC):
+    """Report writing one JSON array item per data row as soon as it comes."""
+
+    def get_file_paths(self, file_path: str) -> List[str]:
+        file_paths = super().get_file_paths(file_path)
+        if self.with_index:
+            file_paths.append(get_index_file_path(file_path))
+
+        return file_paths
+
+    def open(self, file_paths: List[str], state: Optional[dict] = None) -> None:
+        super().open(file_paths, state)
+        items_count = state["items_count"] if state else 0
+
+        self._writer = JsonArrayWriter(self._files[0], items_count)
+        if self.with_index:
+            self._index_writer = ExportIndexWriter(self._files[1], items_count)
+
+        if not state:
+            self._writer.open()
+            if self.with_index:
+                self._index_writer.open()
+
+    def consume(self, data_row: Row) -> None:
+        offset, length = self._writer.write(self._data_row_to_item(data_row))
+        if self.with_index:
+            self._index_writer.write(data_row.Customer.CustomerId, offset, length)
+
+    def finish(self) -> None:
+        self._writer.close()
+        if self.with_index:
+            self._index_writer.close()
+
+    def get_state(self) -> dict:
+        return {**super().get_state(), "items_count": self._writer.items_count}
+
+    @abstractmethod
+    def _data_row_to_item(self, data_row: Row) -> dict:
+        """Map data row to JSON serializable dictionary."""
+
+
+class GroupedTotalsReport(BaseReport, ABC):
+    """Report summing up customers totals by a key and writing them when finished.
+
+    Only one counter per group is kept in memory, so the report is cheap as long
+     as the number of groups is small.
+    """
+
+    key_name: str = None
+
+    def __init__(self, with_index: bool = False):
+        super().__init__(with_index)
+        self._totals: Dict[object, Decimal] = defaultdict(Decimal)
+        self._customers_counts: Dict[object, int] = defaultdict(int)
+
+    def open(self, file_paths: List[str], state: Optional[dict] = None) -> None:
+        super().open(file_paths, state)
+        for key, total_paid, customers_count in state["groups"] if state else []:
+            self._totals[key] = Decimal(total_paid)
+            self._customers_counts[key] = customers_count
+
+    def consume(self, data_row: Row) -> None:
+        key = self._get_key(data_row)
+        self._totals[key] += Decimal(str(data_row.total_paid))
+        self._customers_counts[key] += 1
+
+    def get_state(self) -> dict:
+        return {
+            **super().get_state(),
+            "groups": [
+                [key, str(total_paid), self._customers_counts[key]]
+                for key, total_paid in self._totals.items()
+            ],
+        }
+
+    def finish(self) -> None:
+        writer = JsonArrayWriter(self._files[0])
+        writer.open()
+        for key, total_paid in sorted(
+            self._totals.items(), key=lambda item: item[1], reverse=True
+        ):
+            writer.write({
+                self.key_name: key,
+                "customers_count": self._customers_counts[key],
+                "total_paid": str(total_paid),
+            })
+        writer.close()
+
+    @abstractmethod
+    def _get_key(self, data_row: Row) -> object:
+        """Returns the value the customer's total is grouped by."""
+
+
+@register_report
+class CustomerPaymentsReport(StreamedJsonReport):
+    """Customers with the list of their payments. See README for the format."""
+
+    name = "customer_payments"
+    file_prefix = "customer_payments_data"
+
+    @classmethod
+    def create(
+        cls,
+        with_index: bool = False,
+        output_format: OutputFormat = OutputFormat.JSON
+    ) -> BaseReport:
+        if output_format == OutputFormat.JSON:
+            return cls(with_index=with_index)
+        if with_index:
+            raise ValueError("Sidecar index can be written only for JSON format.")
+
+        return CustomerPaymentsTablesReport(output_format)
+
+    def _data_row_to_item(self, data_row: Row) -> dict:
+        return customer_payment_data_to_dict(data_row)
+
+
+class CustomerPaymentsTablesReport(BaseReport):
+    """Customer payments data normalized to two flat tables, each in its own file.
+
+    Analytical engines can read such files directly without flattening nested
+     payments lists.
+    """
+
+    name = CustomerPaymentsReport.name
+    file_prefix = CustomerPaymentsReport.file_prefix
+    buffer_size = 1024 * 1024
+    tables = {
+        "customers": (
+            ("customer_id", "int"),
+            ("first_name", "str"),
+            ("last_name", "str"),
+            ("total_paid", "decimal"),
+            ("rank", "int"),
+        ),
+        "payments": (
+            ("customer_id", "int"),
+            ("date", "datetime"),
+            ("amount", "decimal"),
+        ),
+    }
+
+    def __init__(self, output_format: OutputFormat):
+        super().__init__()
+        self.file_extension = output_format.value
+        self._writer_class = get_table_writer_class(output_format)
+
+    def get_file_paths(self, file_path: str) -> List[str]:
+        root, extension = os.path.splitext(file_path)
+        return [f"{root}_{table_name}{extension}" for table_name in self.tables]
+
+    def open(self, file_paths: List[str], state: Optional[dict] = None) -> None:
+        if state and not self._writer_class.resumable:
+            raise CheckpointError(
+                f"Unfinished {self.file_extension} files can not be continued. "
+                "Start the export again without resuming."
+            )
+
+        super().open(file_paths, state)
+        self._customers_count = state["customers_count"] if state else 0
+        self._customers_writer, self._payments_writer = [
+            self._writer_class(file, columns)
+            for file, columns in zip(self._files, self.tables.values())
+        ]
+
+        if not state:
+            self._customers_writer.open()
+            self._payments_writer.open()
+
+    def consume(self, data_row: Row) -> None:
+        customer = data_row.Customer
+        self._customers_count += 1
+
+        self._customers_writer.write((
+            customer.CustomerId,
+            customer.FirstName,
+            customer.LastName,
+            data_row.total_paid,
+            self._customers_count,
+        ))
+        for invoice in customer.invoice_collection:
+            self._payments_writer.write(
+                (customer.CustomerId, invoice.InvoiceDate, invoice.Total)
+            )
+
+    def finish(self) -> None:
+        self._customers_writer.close()
+        self._payments_writer.close()
+
+    def get_state(self) -> dict:
+        return {**super().get_state(), "customers_count": self._customers_count}
+
+
+@register_report
+class PurchaseDatesReport(StreamedJsonReport):
+    """First and last purchase dates of every customer."""
+
+    name = "purchase_dates"
+    file_prefix = "customer_purchase_dates"
+
+    def _data_row_to_item(self, data_row: Row) -> dict:
+        invoice_dates = [
+            invoice.InvoiceDate for invoice in data_row.Customer.invoice_collection
+        ]
+
+        return {
+            "customer_id": data_row.Customer.CustomerId,
+            "first_purchase": str(min(invoice_dates)),
+            "last_purchase": str(max(invoice_dates)),
+        }
+
+
+@register_report
+class CountryRevenueReport(GroupedTotalsReport):
+    """Total revenue per customer country."""
+
+    name = "country_revenue"
+    file_prefix = "country_revenue"
+    key_name = "country"
+
+    def _get_key(self, data_row: Row) -> object:
+        return data_row.Customer.Country
+
+
+@register_report
+class SupportRepTotalsReport(GroupedTotalsReport):
+    """Total revenue per support representative of customers."""
+
+    name = "support_rep_totals"
+    file_prefix = "support_rep_totals"
+    key_name = "support_rep_id"
+
+    def _get_key(self, data_row: Row) -> object:
+        return data_row.Customer.SupportRepId
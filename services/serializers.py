@@ -0,0 +1,27 @@
+from sqlalchemy.engine import Row
+
+__all__ = ("customer_payment_data_to_dict",)
+
+
+def customer_payment_data_to_dict(data_row: Row) -> dict:
+    """Map data row of specific format to JSON serializable dictionary.
+
+    :param data_row: SQLAlchemy Row instance that contains two fields:
+                       Customer - instance of Customer model with appropriate data
+                       total_paid - Decimal value. Sum of selected invoices
+    :return: JSON serializable dictionary
+    """
+
+    return {
+        "customer_id": data_row.Customer.CustomerId,
+        "first_name": data_row.Customer.FirstName,
+        "last_name": data_row.Customer.LastName,
+        "total_paid": str(data_row.total_paid),
+        "individual_payments": [
+            {
+                "date": str(invoice.InvoiceDate),
+                "amount": str(invoice.Total)
+
+            } for invoice in data_row.Customer.invoice_collection
+        ]
+    }
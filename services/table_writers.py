@@ -0,0 +1,134 @@
+import csv
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import BinaryIO, Dict, List, Sequence, Tuple, Type
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+__all__ = (
+    "BaseTableWriter",
+    "CsvTableWriter",
+    "OutputFormat",
+    "ParquetTableWriter",
+    "TableColumn",
+    "get_table_writer_class",
+)
+
+
+# Name of a column and the type of its values: "int", "str", "decimal" or "datetime"
+TableColumn = Tuple[str, str]
+
+
+class OutputFormat(str, Enum):
+    JSON = "json"
+    CSV = "csv"
+    PARQUET = "parquet"
+
+    @property
+    def is_available(self) -> bool:
+        return self != OutputFormat.PARQUET or pyarrow is not None
+
+
+class BaseTableWriter(ABC):
+    """Writes rows of a flat table to a binary file one by one.
+
+    `resumable` tells whether the file can be truncated to a flushed position and
+     written further by a new writer.
+    """
+
+    resumable = True
+
+    def __init__(self, file: BinaryIO, columns: Sequence[TableColumn]):
+        self._file = file
+        self._columns = columns
+
+    def open(self) -> None:
+        """Called once before the first row of a new file is written."""
+
+    @abstractmethod
+    def write(self, row: tuple) -> None:
+        """Append row with values in the order of columns."""
+
+    def close(self) -> None:
+        """Called once after the last row is written."""
+
+
+class CsvTableWriter(BaseTableWriter):
+    def __init__(self, file: BinaryIO, columns: Sequence[TableColumn]):
+        super().__init__(file, columns)
+        self._writer = csv.writer(_Utf8Encoder(file))
+
+    def open(self) -> None:
+        self._writer.writerow([name for name, _ in self._columns])
+
+    def write(self, row: tuple) -> None:
+        self._writer.writerow(row)
+
+
+class ParquetTableWriter(BaseTableWriter):
+    """Buffers rows column by column and writes them as row groups of fixed size.
+
+    Parquet file metadata is written at the end of the file, so an unfinished file
+     can not be continued.
+    """
+
+    resumable = False
+    row_group_size = 100000
+
+    def __init__(self, file: BinaryIO, columns: Sequence[TableColumn]):
+        if pyarrow is None:
+            raise RuntimeError("Parquet format requires 'pyarrow' package to be installed.")
+
+        super().__init__(file, columns)
+        types = {
+            "int": pyarrow.int64(),
+            "str": pyarrow.string(),
+            "decimal": pyarrow.decimal128(38, 2),
+            "datetime": pyarrow.timestamp("us"),
+        }
+        self._schema = pyarrow.schema([(name, types[type_]) for name, type_ in columns])
+        self._buffer: Dict[str, List] = {name: [] for name, _ in columns}
+        self._buffered_rows = 0
+        self._writer = pyarrow.parquet.ParquetWriter(file, self._schema)
+
+    def write(self, row: tuple) -> None:
+        for (name, _), value in zip(self._columns, row):
+            self._buffer[name].append(value)
+
+        self._buffered_rows += 1
+        if self._buffered_rows >= self.row_group_size:
+            self._write_row_group()
+
+    def close(self) -> None:
+        if self._buffered_rows:
+            self._write_row_group()
+        self._writer.close()
+
+    def _write_row_group(self) -> None:
+        self._writer.write_table(pyarrow.table(self._buffer, schema=self._schema))
+        self._buffer = {name: [] for name, _ in self._columns}
+        self._buffered_rows = 0
+
+
+class _Utf8Encoder:
+    """Text interface for csv.writer on top of a binary file.
+
+    Unlike io.TextIOWrapper it does not buffer text and does not own the file.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+
+    def write(self, text: str) -> int:
+        return self._file.write(text.encode())
+
+
+def get_table_writer_class(output_format: OutputFormat) -> Type[BaseTableWriter]:
+    return {
+        OutputFormat.CSV: CsvTableWriter,
+        OutputFormat.PARQUET: ParquetTableWriter,
+    }[output_format]
@@ -1,6 +1,8 @@
+import glob
 import os
+from typing import List
 
-from pydantic import BaseSettings
+from pydantic import BaseSettings, validator
 
 __all__ = ("settings",)
 
@@ -14,9 +16,35 @@ class Settings(BaseSettings):
     DB_ECHO: bool = False
     DB_URL: str = default_db_file_path
 
+    @validator("DB_URL")
+    def db_url_matches_database(cls, value: str) -> str:
+        if not split_db_urls(value):
+            raise ValueError(f"DB_URL does not match any database file: {value}")
+
+        return value
+
     @property
-    def DB_URI(self):
-        return f"{self.DB_DRIVER}{self.DB_URL}"
+    def DB_URLS(self) -> List[str]:
+        """Addresses of all database shards. The first one is the main database."""
+
+        return split_db_urls(self.DB_URL)
+
+
+def split_db_urls(value: str) -> List[str]:
+    """Split comma separated list of database addresses and expand glob patterns in it.
+
+    Files matched by a pattern are sorted by name, so the main database is stable.
+    """
+
+    db_urls = []
+    for db_url in value.split(","):
+        db_url = db_url.strip()
+        if any(char in db_url for char in "*?["):
+            db_urls.extend(sorted(glob.glob(db_url)))
+        elif db_url:
+            db_urls.append(db_url)
+
+    return db_urls
 
 
 settings = Settings(
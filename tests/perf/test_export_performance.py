@@ -0,0 +1,255 @@
+import os
+import sqlite3
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional
+
+import pytest
+from sqlalchemy.orm import Session
+
+from db.meta import create_db_engine, get_shard_schemas
+from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.export_planner import ExportStrategy
+from services.reports import CustomerPaymentsReport, iter_json_array_chunks
+from services.serializers import customer_payment_data_to_dict
+
+pytestmark = pytest.mark.perf
+
+
+# Size of the large dataset, can be raised up to 10^6 to profile big exports.
+# The small dataset is 10 times smaller, both have the same invoices per customer.
+INVOICES_COUNT = int(os.getenv("PERF_INVOICES_COUNT", 100000))
+INVOICES_PER_CUSTOMER = 5
+# Small batches keep loading of ORM objects cheap, so time spent by the database
+# on each batch is not hidden by it
+BATCH_SIZE = 100
+
+# Allowed slowdown of the last batches compared to the first ones
+MAX_BATCH_TIME_GROWTH = 2.0
+# Allowed growth of batch time and peak memory when the dataset is 10 times larger.
+# Strategies which re-calculate customers totals for every batch, like OFFSET
+# batches, make batches slower in proportion to the number of invoices.
+MAX_BATCH_TIME_GROWTH_WITH_DATASET = 2.0
+# Number of batches enough to compare batch times of datasets
+COMPARED_BATCHES_COUNT = 50
+MAX_PEAK_MEMORY_GROWTH_WITH_DATASET = 1.5
+# Lower bound of JSON encoding speed of customer payments data, in MB per second
+MIN_SERIALIZATION_THROUGHPUT = 2.0
+
+
+@pytest.fixture(scope="session")
+def get_db_templates(tmp_path_factory) -> Callable[[int, int], List[str]]:
+    """Database files of the dataset split into shards, each built once per session."""
+
+    templates_path = tmp_path_factory.mktemp("perf_templates")
+    templates = {}
+
+    def get(invoices_count: int, shards_count: int) -> List[str]:
+        if (invoices_count, shards_count) not in templates:
+            templates[invoices_count, shards_count] = [
+                _create_template_db(
+                    str(templates_path / f"invoices_{invoices_count}_{shard_number}_of_{shards_count}.sqlite"),
+                    invoices_count,
+                    shard_number,
+                    shards_count
+                )
+                for shard_number in range(shards_count)
+            ]
+
+        return templates[invoices_count, shards_count]
+
+    return get
+
+
+@pytest.fixture
+def create_service(get_db_templates, tmp_path) -> Iterator[Callable[..., CustomerPaymentsDataService]]:
+    """Factory of services reading a fresh copy of the dataset with given size.
+
+    Copies are made with SQLite backup API, which copies database pages without
+     re-inserting rows. If the dataset is split into several shards, customers are
+     present in all of them and invoices are spread evenly.
+    """
+
+    engines = []
+    sessions = []
+
+    def create(invoices_count: int, shards_count: int = 1) -> CustomerPaymentsDataService:
+        db_paths = []
+        for template_path in get_db_templates(invoices_count, shards_count):
+            db_paths.append(str(tmp_path / f"{len(engines)}_{os.path.basename(template_path)}"))
+            source = sqlite3.connect(template_path)
+            target = sqlite3.connect(db_paths[-1])
+            source.backup(target)
+            source.close()
+            target.close()
+
+        engines.append(create_db_engine(db_paths))
+        sessions.append(Session(engines[-1]))
+        return CustomerPaymentsDataService(sessions[-1], get_shard_schemas(db_paths))
+
+    yield create
+
+    for session in sessions:
+        session.close()
+    for engine in engines:
+        engine.dispose()
+
+
+class TestExportPerformance:
+    @pytest.mark.parametrize("shards_count", [1, 2])
+    def test_batch_time_should_not_grow_during_export(self, create_service, shards_count: int):
+        # act
+        batch_times = _measure_batch_times(
+            create_service(INVOICES_COUNT, shards_count), ExportStrategy.RANKED_TEMP_TABLE
+        )
+
+        # assert
+        # the first batch also calculates customers totals, so it is not compared
+        quarter = len(batch_times) // 4
+        first_batches_time = statistics.median(batch_times[1:quarter + 1])
+        last_batches_time = statistics.median(batch_times[-quarter:])
+
+        assert last_batches_time <= first_batches_time * MAX_BATCH_TIME_GROWTH, batch_times
+
+    @pytest.mark.parametrize("strategy, shards_count", [
+        (ExportStrategy.RANKED_TEMP_TABLE, 1),
+        (ExportStrategy.RANKED_TEMP_TABLE, 2),
+        pytest.param(
+            ExportStrategy.OFFSET_BATCHES,
+            1,
+            marks=pytest.mark.xfail(
+                reason="customers totals are re-calculated for every batch", strict=True
+            )
+        ),
+    ])
+    def test_batch_time_should_not_grow_with_dataset_size(
+        self, create_service, strategy: ExportStrategy, shards_count: int
+    ):
+        # act
+        median_batch_times = []
+        for invoices_count in (INVOICES_COUNT // 10, INVOICES_COUNT):
+            batch_times = _measure_batch_times(
+                create_service(invoices_count, shards_count), strategy, COMPARED_BATCHES_COUNT
+            )
+            median_batch_times.append(statistics.median(batch_times[1:]))
+
+        # assert
+        small_time, large_time = median_batch_times
+        assert large_time <= small_time * MAX_BATCH_TIME_GROWTH_WITH_DATASET, median_batch_times
+
+    def test_peak_memory_should_not_grow_with_dataset_size(self, create_service, tmp_path):
+        # act
+        peaks = []
+        for invoices_count in (INVOICES_COUNT // 10, INVOICES_COUNT):
+            service = create_service(invoices_count)
+            plan = service.plan_export()
+            plan.strategy = ExportStrategy.RANKED_TEMP_TABLE
+            plan.batch_size = BATCH_SIZE
+
+            tracemalloc.start()
+            try:
+                service.generate_reports(
+                    report_classes=[CustomerPaymentsReport],
+                    path=str(tmp_path / str(invoices_count)),
+                    plan=plan
+                )
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+        # assert
+        small_peak, large_peak = peaks
+        assert large_peak <= small_peak * MAX_PEAK_MEMORY_GROWTH_WITH_DATASET, peaks
+
+    def test_serialization_throughput_should_exceed_floor(self, create_service):
+        # assemble
+        data_rows = list(
+            create_service(INVOICES_COUNT // 10)._get_data_rows_generator(
+                batch_size=BATCH_SIZE, strategy=ExportStrategy.RANKED_TEMP_TABLE
+            )
+        )
+
+        # act
+        started_at = time.perf_counter()
+        encoded_bytes = sum(
+            len(chunk) for chunk in iter_json_array_chunks(
+                customer_payment_data_to_dict(data_row) for data_row in data_rows
+            )
+        )
+        elapsed = time.perf_counter() - started_at
+
+        # assert
+        throughput = encoded_bytes / elapsed / 1024 ** 2
+        assert throughput >= MIN_SERIALIZATION_THROUGHPUT, f"{throughput:.2f} MB/s"
+
+
+def _measure_batch_times(
+    service: CustomerPaymentsDataService,
+    strategy: ExportStrategy,
+    max_batches_count: Optional[int] = None
+) -> List[float]:
+    """Time of retrieving each batch of the export with the strategy.
+
+    The strategy is not taken from the planner, since it depends on the dataset
+     size and datasets of different sizes have to be compared on the same one.
+    """
+
+    data_rows = service._get_data_rows_generator(batch_size=BATCH_SIZE, strategy=strategy)
+
+    batch_times = []
+    started_at = time.perf_counter()
+    for number, _ in enumerate(data_rows, start=1):
+        if number % BATCH_SIZE == 0:
+            finished_at = time.perf_counter()
+            batch_times.append(finished_at - started_at)
+            started_at = finished_at
+
+            if len(batch_times) == max_batches_count:
+                data_rows.close()
+                break
+
+    return batch_times
+
+
+def _create_template_db(
+    db_path: str,
+    invoices_count: int,
+    shard_number: int = 0,
+    shards_count: int = 1
+) -> str:
+    with open(os.path.join(os.getcwd(), "tests", "testing_schema_generator.sql")) as file:
+        schema = file.read()
+
+    customers_count = invoices_count // INVOICES_PER_CUSTOMER
+    first_date = datetime(year=2001, month=1, day=1)
+
+    connection = sqlite3.connect(db_path)
+    connection.executescript(schema)
+    connection.executemany(
+        "INSERT INTO Customer (CustomerId, FirstName, LastName, Email) VALUES (?, ?, ?, ?)",
+        (
+            (customer_id, f"First {customer_id}", f"Last {customer_id}", f"{customer_id}@example.com")
+            for customer_id in range(1, customers_count + 1)
+        )
+    )
+    # totals are spread, so that customers ranking is not the order of ids,
+    # invoices of each customer are spread across shards
+    connection.executemany(
+        "INSERT INTO Invoice (InvoiceId, CustomerId, InvoiceDate, Total) VALUES (?, ?, ?, ?)",
+        (
+            (
+                invoice_id,
+                invoice_id % customers_count + 1,
+                str(first_date + timedelta(hours=invoice_id)),
+                f"{invoice_id * 7919 % 2000 / 100:.2f}",
+            )
+            for invoice_id in range(1, invoices_count + 1)
+            if invoice_id // customers_count % shards_count == shard_number
+        )
+    )
+    connection.commit()
+    connection.close()
+
+    return db_path
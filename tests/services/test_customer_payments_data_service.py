@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 
 from db.models import Customer, Invoice
 from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.export_planner import ExportStrategy
 from tests.factories import CustomerFactory, InvoiceFactory
 
 
@@ -325,6 +326,48 @@ class TestCustomerPaymentsDataService:
         self._assert_customer_data(customer_2_data, self.customer_2, [self.invoice_1_2, self.invoice_2_2])
         self._assert_customer_data(customer_3_data, self.customer_3, [self.invoice_1_3, self.invoice_2_3])
 
+    @pytest.mark.parametrize("batch_size", [1, 2, 10])
+    def test_should_return_same_data_when_ranked_temp_table_strategy(
+        self, session: Session, batch_size: int
+    ):
+        # act
+        generator = CustomerPaymentsDataService(session)._get_data_generator(
+            start_date=self.date_1,
+            end_date=self.date_3,
+            batch_size=batch_size,
+            strategy=ExportStrategy.RANKED_TEMP_TABLE
+        )
+
+        # assert
+        data = list(generator)
+
+        # check only 3 customers returned in right order
+        assert [data_row["customer_id"] for data_row in data] == [
+            self.customer_1.CustomerId,
+            self.customer_2.CustomerId,
+            self.customer_3.CustomerId
+        ]
+
+        # check customer's data is right
+        self._assert_customer_data(data[0], self.customer_1, [self.invoice_1_1, self.invoice_2_1])
+        self._assert_customer_data(data[1], self.customer_2, [self.invoice_1_2, self.invoice_2_2])
+        self._assert_customer_data(data[2], self.customer_3, [self.invoice_1_3, self.invoice_2_3])
+
+    def test_should_return_same_data_when_date_index_is_not_used(self, session: Session):
+        # act
+        data_rows = CustomerPaymentsDataService(session)._get_data_rows_generator(
+            start_date=self.date_4,
+            use_date_index=False
+        )
+
+        # assert
+        assert [data_row.Customer.CustomerId for data_row in data_rows] == [
+            self.customer_1.CustomerId,
+            self.customer_2.CustomerId,
+            self.customer_3.CustomerId,
+            self.customer_4.CustomerId
+        ]
+
     def _assert_customer_data(self, data: dict, customer: Customer, invoices: List[Invoice]):
         assert data == {
             "customer_id": customer.CustomerId,
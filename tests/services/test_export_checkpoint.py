@@ -0,0 +1,259 @@
+import os
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+import simplejson
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.export_checkpoint import CHECKPOINT_FILE_NAME, CheckpointError, ExportCheckpoint
+from services.export_index import ExportReader
+from services.reports import CountryRevenueReport, CustomerPaymentsReport
+from tests.factories import CustomerFactory, InvoiceFactory
+
+
+class InterruptedExport(Exception):
+    pass
+
+
+class FailingCustomerPaymentsReport(CustomerPaymentsReport):
+    fail_on_row = 3
+
+    def consume(self, data_row: Row) -> None:
+        self.fail_on_row -= 1
+        if not self.fail_on_row:
+            raise InterruptedExport()
+
+        super().consume(data_row)
+
+
+class TestResumableExport:
+    @pytest.fixture(autouse=True)
+    def setup_data(self) -> None:
+        self.customers = [
+            CustomerFactory(Country=country) for country in ["Chile", "Norway", "Chile", "Norway"]
+        ]
+
+        for position, customer in enumerate(self.customers):
+            InvoiceFactory(
+                CustomerId=customer.CustomerId,
+                InvoiceDate=datetime(year=2001, month=1, day=1),
+                Total=Decimal(10 - position)
+            )
+
+    def test_should_not_leave_checkpoint_and_part_files_when_complete(
+        self, session: Session, tmp_path
+    ):
+        # act
+        CustomerPaymentsDataService(session).generate_reports(
+            report_classes=[CustomerPaymentsReport],
+            path=str(tmp_path),
+            with_index=True,
+            checkpoint_interval=1
+        )
+
+        # assert
+        file_names = sorted(os.listdir(tmp_path))
+        assert len(file_names) == 2
+        assert file_names[0].endswith(".json")
+        assert file_names[1] == f"{file_names[0]}.idx"
+
+    def test_should_keep_part_files_and_checkpoint_when_interrupted(
+        self, session: Session, tmp_path
+    ):
+        # act
+        with pytest.raises(InterruptedExport):
+            CustomerPaymentsDataService(session).generate_reports(
+                report_classes=[FailingCustomerPaymentsReport],
+                path=str(tmp_path),
+                checkpoint_interval=1
+            )
+
+        # assert
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".json")]
+        assert [name for name in os.listdir(tmp_path) if name.endswith(".json.part")]
+
+        checkpoint = ExportCheckpoint.load(os.path.join(tmp_path, CHECKPOINT_FILE_NAME))
+        assert checkpoint.cursor == 2
+
+    def test_should_resume_interrupted_export(self, session: Session, tmp_path):
+        # assemble
+        expected_path = tmp_path / "expected"
+        resumed_path = tmp_path / "resumed"
+        service = CustomerPaymentsDataService(session)
+
+        service.generate_reports(
+            report_classes=[CustomerPaymentsReport, CountryRevenueReport],
+            path=str(expected_path),
+            with_index=True
+        )
+        with pytest.raises(InterruptedExport):
+            service.generate_reports(
+                report_classes=[FailingCustomerPaymentsReport, CountryRevenueReport],
+                path=str(resumed_path),
+                with_index=True,
+                checkpoint_interval=1
+            )
+
+        # act
+        service.generate_reports(
+            report_classes=[CustomerPaymentsReport, CountryRevenueReport],
+            path=str(resumed_path),
+            with_index=True,
+            resume=True
+        )
+
+        # assert
+        assert sorted(os.listdir(resumed_path)) == sorted(os.listdir(expected_path))
+        for file_name in os.listdir(expected_path):
+            if file_name.endswith(".json"):
+                assert self._load(resumed_path / file_name) == self._load(expected_path / file_name)
+
+        customer_payments_file_name = next(
+            name for name in os.listdir(resumed_path) if name.startswith("customer_payments")
+            and name.endswith(".json")
+        )
+        with ExportReader(str(resumed_path / customer_payments_file_name)) as reader:
+            assert [item["customer_id"] for item in reader] == [
+                customer.CustomerId for customer in self.customers
+            ]
+            assert reader.get_customer(self.customers[3].CustomerId)["total_paid"] == "7.00"
+
+    def test_should_raise_exception_when_resumed_with_other_params(
+        self, session: Session, tmp_path
+    ):
+        # assemble
+        service = CustomerPaymentsDataService(session)
+        with pytest.raises(InterruptedExport):
+            service.generate_reports(
+                report_classes=[FailingCustomerPaymentsReport],
+                path=str(tmp_path),
+                checkpoint_interval=1
+            )
+
+        # act
+        with pytest.raises(CheckpointError):
+            service.generate_reports(
+                report_classes=[CustomerPaymentsReport],
+                start_date=datetime(year=2000, month=1, day=1),
+                path=str(tmp_path),
+                resume=True
+            )
+
+    def test_should_raise_exception_when_nothing_to_resume(self, session: Session, tmp_path):
+        # act
+        with pytest.raises(CheckpointError):
+            CustomerPaymentsDataService(session).generate_reports(
+                report_classes=[CustomerPaymentsReport],
+                path=str(tmp_path),
+                resume=True
+            )
+
+    def test_should_raise_exception_when_new_export_started_over_unfinished_one(
+        self, session: Session, tmp_path
+    ):
+        # assemble
+        service = CustomerPaymentsDataService(session)
+        with pytest.raises(InterruptedExport):
+            service.generate_reports(
+                report_classes=[FailingCustomerPaymentsReport],
+                path=str(tmp_path),
+                checkpoint_interval=1
+            )
+
+        # act
+        with pytest.raises(CheckpointError, match="--resume"):
+            service.generate_reports(
+                report_classes=[CustomerPaymentsReport],
+                start_date=datetime(year=2000, month=1, day=1),
+                path=str(tmp_path)
+            )
+
+        # assert
+        service.generate_reports(
+            report_classes=[CustomerPaymentsReport],
+            path=str(tmp_path),
+            resume=True
+        )
+        assert not os.path.exists(tmp_path / CHECKPOINT_FILE_NAME)
+
+    def test_should_raise_exception_when_resumed_after_files_are_renamed(
+        self, session: Session, tmp_path, monkeypatch
+    ):
+        # assemble
+        def interrupt(path):
+            raise InterruptedExport()
+
+        service = CustomerPaymentsDataService(session)
+        with monkeypatch.context() as patch:
+            # the process dies right before the checkpoint is removed
+            patch.setattr(os, "remove", interrupt)
+            with pytest.raises(InterruptedExport):
+                service.generate_reports(
+                    report_classes=[CustomerPaymentsReport],
+                    path=str(tmp_path),
+                    checkpoint_interval=1
+                )
+
+        # act
+        with pytest.raises(CheckpointError, match="already complete"):
+            service.generate_reports(
+                report_classes=[CustomerPaymentsReport],
+                path=str(tmp_path),
+                resume=True
+            )
+
+    def test_should_raise_exception_when_part_file_is_missing(self, session: Session, tmp_path):
+        # assemble
+        service = CustomerPaymentsDataService(session)
+        with pytest.raises(InterruptedExport):
+            service.generate_reports(
+                report_classes=[FailingCustomerPaymentsReport],
+                path=str(tmp_path),
+                checkpoint_interval=1
+            )
+        for name in os.listdir(tmp_path):
+            if name.endswith(".part"):
+                os.remove(os.path.join(tmp_path, name))
+
+        # act
+        with pytest.raises(CheckpointError, match="not found"):
+            service.generate_reports(
+                report_classes=[CustomerPaymentsReport],
+                path=str(tmp_path),
+                resume=True
+            )
+
+    def test_should_raise_exception_when_part_file_is_shorter_than_checkpoint(
+        self, session: Session, tmp_path
+    ):
+        # assemble
+        service = CustomerPaymentsDataService(session)
+        with pytest.raises(InterruptedExport):
+            service.generate_reports(
+                report_classes=[FailingCustomerPaymentsReport],
+                path=str(tmp_path),
+                checkpoint_interval=1
+            )
+        # data written before the checkpoint did not reach the disk
+        [part_file_path] = tmp_path.glob("*.part")
+        with open(part_file_path, "r+b") as file:
+            file.truncate(1)
+
+        # act
+        with pytest.raises(CheckpointError, match="shorter"):
+            service.generate_reports(
+                report_classes=[CustomerPaymentsReport],
+                path=str(tmp_path),
+                resume=True
+            )
+
+        # assert
+        assert part_file_path.read_bytes() == b"["
+
+    @staticmethod
+    def _load(file_path) -> list:
+        with open(file_path) as file:
+            return simplejson.load(file)
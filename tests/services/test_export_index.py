@@ -0,0 +1,116 @@
+import os
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+import simplejson
+from sqlalchemy.orm import Session
+
+from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.export_index import (
+    ExportIndexWriter,
+    ExportReader,
+    get_index_file_path,
+    HEADER,
+    ID_ENTRY,
+    RANK_ENTRY,
+)
+from tests.factories import CustomerFactory, InvoiceFactory
+
+
+class TestExportReader:
+    @pytest.fixture(autouse=True)
+    def setup_data(self, session: Session, tmp_path) -> None:
+        self.customers = [CustomerFactory() for _ in range(5)]
+
+        # customer with the lowest id has the highest total
+        for position, customer in enumerate(self.customers):
+            InvoiceFactory(
+                CustomerId=customer.CustomerId,
+                InvoiceDate=datetime(year=2001, month=1, day=1),
+                Total=Decimal(10 - position)
+            )
+
+        CustomerPaymentsDataService(session).load_customers_payment_data_to_json(
+            path=str(tmp_path),
+            with_index=True
+        )
+        self.file_path = os.path.join(
+            tmp_path, next(name for name in os.listdir(tmp_path) if name.endswith(".json"))
+        )
+
+    def test_should_write_index_next_to_export_file(self):
+        # assert
+        assert os.path.exists(get_index_file_path(self.file_path))
+
+    def test_should_iterate_items_in_export_order(self):
+        # act
+        with ExportReader(self.file_path) as reader:
+            data = list(reader)
+
+        # assert
+        with open(self.file_path) as file:
+            assert data == simplejson.load(file)
+        assert len(data) == 5
+
+    def test_should_return_customer_by_id(self):
+        # act
+        with ExportReader(self.file_path) as reader:
+            items = [reader.get_customer(customer.CustomerId) for customer in self.customers]
+            missing_item = reader.get_customer(-1)
+
+        # assert
+        assert [item["customer_id"] for item in items] == [
+            customer.CustomerId for customer in self.customers
+        ]
+        assert items[0]["total_paid"] == "10.00"
+        assert missing_item is None
+
+    def test_should_return_rank_range(self):
+        # act
+        with ExportReader(self.file_path) as reader:
+            items = list(reader.get_rank_range(2, 3))
+            out_of_range_items = list(reader.get_rank_range(5, 10))
+            item = reader.get_rank(1)
+
+        # assert
+        assert [item["customer_id"] for item in items] == [
+            self.customers[1].CustomerId,
+            self.customers[2].CustomerId,
+        ]
+        assert [item["customer_id"] for item in out_of_range_items] == [
+            self.customers[4].CustomerId
+        ]
+        assert item["customer_id"] == self.customers[0].CustomerId
+
+    def test_should_raise_exception_when_rank_out_of_range(self):
+        # act
+        with ExportReader(self.file_path) as reader:
+            with pytest.raises(IndexError):
+                reader.get_rank(6)
+
+
+class TestExportIndexWriter:
+    def test_should_sort_id_section_in_several_runs(self, tmp_path):
+        # assemble
+        customer_ids = [7, 3, 9, 1, 8, 2, 6, 4, 5]
+        index_path = str(tmp_path / "export.json.idx")
+
+        # act
+        with open(index_path, "w+b") as file:
+            writer = ExportIndexWriter(file)
+            writer.sort_chunk_size = 2
+            writer.merge_block_size = 1
+            writer.open()
+            for position, customer_id in enumerate(customer_ids):
+                writer.write(customer_id, position * 10, 10)
+            writer.close()
+
+        # assert
+        with open(index_path, "rb") as file:
+            index = file.read()
+
+        id_section = index[HEADER.size + len(customer_ids) * RANK_ENTRY.size:]
+        assert list(ID_ENTRY.iter_unpack(id_section)) == sorted(
+            (customer_id, rank) for rank, customer_id in enumerate(customer_ids, start=1)
+        )
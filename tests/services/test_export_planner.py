@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.export_planner import ExportPlanner, ExportStrategy
+from tests.factories import CustomerFactory, InvoiceFactory
+
+
+class TestExportPlanner:
+    @pytest.fixture(autouse=True)
+    def setup_data(self, session: Session) -> None:
+        self.start_date = datetime(year=2001, month=1, day=1)
+        self.customers = [CustomerFactory() for _ in range(5)]
+
+        for customer in self.customers:
+            for day in range(4):
+                InvoiceFactory(
+                    CustomerId=customer.CustomerId,
+                    InvoiceDate=self.start_date + timedelta(days=day),
+                    Total=Decimal("1.98")
+                )
+
+        # statistics are read with plain SQL which does not flush the session
+        session.flush()
+
+    def test_should_estimate_whole_data_when_no_dates(self, session: Session):
+        # act
+        plan = ExportPlanner(session).plan()
+
+        # assert
+        assert plan.estimated_invoices == 20
+        assert plan.estimated_customers == 5
+        assert plan.estimated_output_bytes == (
+            5 * ExportPlanner.customer_record_bytes
+            + 20 * ExportPlanner.payment_record_bytes
+        )
+        assert plan.strategy == ExportStrategy.OFFSET_BATCHES
+        assert not plan.use_date_index
+
+    def test_should_use_ranked_temp_table_when_many_batches(self, session: Session):
+        # assemble
+        planner = ExportPlanner(session)
+        planner.max_batch_size = planner.min_batch_size = 2
+
+        # act
+        plan = planner.plan()
+
+        # assert
+        assert plan.batch_size == 2
+        assert plan.strategy == ExportStrategy.RANKED_TEMP_TABLE
+
+    def test_should_count_invoices_when_date_index_exists(self, session: Session):
+        # assemble
+        session.execute(text('CREATE INDEX "IX_InvoiceDate" ON "Invoice" ("InvoiceDate")'))
+
+        # act
+        plan = ExportPlanner(session).plan(
+            start_date=self.start_date + timedelta(days=3)
+        )
+
+        # assert
+        assert plan.estimated_invoices == 5
+        assert plan.use_date_index
+
+    def test_should_scan_table_when_date_range_is_wide(self, session: Session):
+        # assemble
+        session.execute(text('CREATE INDEX "IX_InvoiceDate" ON "Invoice" ("InvoiceDate")'))
+
+        # act
+        plan = ExportPlanner(session).plan(start_date=self.start_date)
+
+        # assert
+        assert plan.estimated_invoices == 20
+        assert not plan.use_date_index
+
+    def test_should_guess_invoices_count_when_no_date_index(self, session: Session):
+        # act
+        plan = ExportPlanner(session).plan(
+            start_date=self.start_date,
+            end_date=self.start_date + timedelta(days=1)
+        )
+
+        # assert
+        assert plan.estimated_invoices == 2
+
+    def test_should_add_query_plan_when_explain(self, session: Session):
+        # act
+        plan = CustomerPaymentsDataService(session).plan_export(
+            start_date=self.start_date,
+            explain=True
+        )
+
+        # assert
+        assert plan.query_plan
+        assert any("Invoice" in line for line in plan.query_plan)
+        assert "Query plan:" in plan.explain()
@@ -0,0 +1,255 @@
+import asyncio
+import gc
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+import simplejson
+from sqlalchemy.orm import Session, sessionmaker
+
+from db.meta import create_db_engine
+from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.export_stream import (
+    aiter_customers_payment_data,
+    aiter_customers_payment_data_json,
+    AsyncExportStream,
+)
+from tests.factories import CustomerFactory, InvoiceFactory
+
+
+class TestIterCustomersPaymentData:
+    @pytest.fixture(autouse=True)
+    def setup_data(self) -> None:
+        self.customers = [CustomerFactory() for _ in range(3)]
+        for number, customer in enumerate(self.customers):
+            InvoiceFactory(
+                CustomerId=customer.CustomerId,
+                InvoiceDate=datetime(year=2001, month=1, day=1),
+                Total=Decimal(10 - number)
+            )
+
+    def test_should_yield_customers_in_report_order(self, session: Session):
+        # act
+        data = list(CustomerPaymentsDataService(session).iter_customers_payment_data())
+
+        # assert
+        assert [row["customer_id"] for row in data] == [
+            customer.CustomerId for customer in self.customers
+        ]
+
+    def test_should_yield_json_chunks_equal_to_report_file(self, session: Session, tmp_path):
+        # assemble
+        service = CustomerPaymentsDataService(session)
+        service.load_customers_payment_data_to_json(path=str(tmp_path))
+        [file_path] = tmp_path.glob("*.json")
+
+        # act
+        chunks = list(service.iter_customers_payment_data_json(chunk_size=100))
+
+        # assert
+        assert len(chunks) > 1
+        assert all(len(chunk) >= 100 for chunk in chunks[:-1])
+        assert b"".join(chunks) == file_path.read_bytes()
+
+
+class TestAsyncExportStream:
+    def test_should_iterate_in_worker_thread(self):
+        # assemble
+        threads = set()
+
+        def iter_numbers():
+            for number in range(5):
+                threads.add(threading.current_thread())
+                yield number
+
+        # act
+        items = asyncio.run(self._collect(AsyncExportStream(iter_numbers, prefetch=2)))
+
+        # assert
+        assert items == [0, 1, 2, 3, 4]
+        assert threading.current_thread() not in threads
+
+    def test_should_read_only_one_batch_ahead_of_consumer(self):
+        # assemble
+        read_count = 0
+
+        def iter_numbers():
+            nonlocal read_count
+            for number in range(1000):
+                read_count += 1
+                yield number
+
+        async def consume_slowly() -> None:
+            async with AsyncExportStream(iter_numbers, prefetch=10) as stream:
+                await stream.__anext__()
+                for _ in range(5):
+                    await asyncio.sleep(0.01)
+
+        # act
+        asyncio.run(consume_slowly())
+
+        # assert
+        assert read_count <= 20
+
+    def test_should_close_blocking_iterator_when_consumer_stops(self):
+        # assemble
+        closed_in_threads = []
+
+        def iter_numbers():
+            try:
+                yield from range(1000)
+            finally:
+                closed_in_threads.append(threading.current_thread())
+
+        async def consume_first() -> int:
+            async with AsyncExportStream(iter_numbers, prefetch=10) as stream:
+                async for number in stream:
+                    return number
+
+        # act
+        first = asyncio.run(consume_first())
+
+        # assert
+        assert first == 0
+        assert len(closed_in_threads) == 1
+        assert closed_in_threads[0] is not threading.current_thread()
+
+    def test_should_close_blocking_iterator_when_cancelled_consumer_does_not_close_stream(self):
+        # assemble
+        closed = threading.Event()
+        closed_in_threads = []
+
+        def iter_numbers():
+            try:
+                yield from range(1000)
+            finally:
+                closed_in_threads.append(threading.current_thread())
+                closed.set()
+
+        async def consume_forever() -> None:
+            async for _ in AsyncExportStream(iter_numbers, prefetch=10):
+                await asyncio.sleep(1)
+
+        async def cancel_consumer() -> None:
+            consumer = asyncio.ensure_future(consume_forever())
+            await asyncio.sleep(0.1)
+            consumer.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await consumer
+
+        # act
+        asyncio.run(cancel_consumer())
+        gc.collect()
+
+        # assert
+        # database connections opened by the iterator can be closed only in the
+        # worker thread
+        assert closed.wait(timeout=5)
+        assert closed_in_threads[0] is not threading.current_thread()
+
+    def test_should_continue_after_cancelled_wait(self):
+        # assemble
+        release = threading.Event()
+
+        def iter_numbers():
+            release.wait()
+            yield from range(3)
+
+        async def cancel_and_continue() -> list:
+            stream = AsyncExportStream(iter_numbers, prefetch=2)
+            waiting = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            release.set()
+
+            return [number async for number in stream]
+
+        # act
+        items = asyncio.run(cancel_and_continue())
+
+        # assert
+        assert items == [0, 1, 2]
+
+    def test_should_raise_error_of_blocking_iterator(self):
+        # assemble
+        def iter_numbers():
+            yield 1
+            raise RuntimeError("Connection lost")
+
+        # act & assert
+        with pytest.raises(RuntimeError, match="Connection lost"):
+            asyncio.run(self._collect(AsyncExportStream(iter_numbers, prefetch=1)))
+
+    @staticmethod
+    async def _collect(stream: AsyncExportStream) -> list:
+        return [item async for item in stream]
+
+
+class TestAsyncCustomersPaymentData:
+    @pytest.fixture(autouse=True)
+    def setup_data(self, tmp_path) -> None:
+        db_path = str(tmp_path / "invoices.sqlite")
+        with open(os.path.join(os.getcwd(), "tests", "testing_schema_generator.sql")) as file:
+            schema = file.read()
+
+        connection = sqlite3.connect(db_path)
+        connection.executescript(schema)
+        connection.executemany(
+            "INSERT INTO Customer (CustomerId, FirstName, LastName, Email) VALUES (?, ?, ?, '')",
+            [(customer_id, f"First {customer_id}", f"Last {customer_id}") for customer_id in range(1, 51)]
+        )
+        connection.executemany(
+            "INSERT INTO Invoice (CustomerId, InvoiceDate, Total) VALUES (?, ?, ?)",
+            [
+                (customer_id, f"200{year}-01-01 00:00:00", customer_id + year)
+                for customer_id in range(1, 51)
+                for year in range(1, 4)
+            ]
+        )
+        connection.commit()
+        connection.close()
+
+        self.engine = create_db_engine([db_path])
+        self.session_factory = sessionmaker(self.engine)
+
+        yield
+
+        self.engine.dispose()
+
+    def test_should_stream_same_data_as_sync_iterator(self):
+        # assemble
+        with self.session_factory() as session:
+            expected = list(
+                CustomerPaymentsDataService(session, shard_schemas=())
+                .iter_customers_payment_data(start_date=datetime(year=2002, month=1, day=1))
+            )
+
+        # act
+        data = asyncio.run(self._collect(aiter_customers_payment_data(
+            self.session_factory,
+            start_date=datetime(year=2002, month=1, day=1),
+            shard_schemas=(),
+            prefetch=7
+        )))
+
+        # assert
+        assert len(data) == 50
+        assert data == expected
+
+    def test_should_stream_encoded_json_array(self):
+        # act
+        chunks = asyncio.run(self._collect(aiter_customers_payment_data_json(
+            self.session_factory, shard_schemas=(), chunk_size=1024
+        )))
+
+        # assert
+        assert len(chunks) > 1
+        data = simplejson.loads(b"".join(chunks))
+        assert [row["customer_id"] for row in data] == list(range(50, 0, -1))
+
+    @staticmethod
+    async def _collect(stream: AsyncExportStream) -> list:
+        return [item async for item in stream]
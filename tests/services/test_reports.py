@@ -0,0 +1,141 @@
+import os
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+import simplejson
+from sqlalchemy.orm import Session
+
+from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.reports import (
+    CountryRevenueReport,
+    CustomerPaymentsReport,
+    PurchaseDatesReport,
+    SupportRepTotalsReport,
+)
+from tests.factories import CustomerFactory, InvoiceFactory
+
+
+class TestGenerateReports:
+    @pytest.fixture(autouse=True)
+    def setup_data(self) -> None:
+        self.customer_1 = CustomerFactory(Country="Norway", SupportRepId=1)
+        self.customer_2 = CustomerFactory(Country="Norway", SupportRepId=2)
+        self.customer_3 = CustomerFactory(Country="Chile", SupportRepId=2)
+
+        self.date_1 = datetime(year=2001, month=1, day=1)
+        self.date_2 = datetime(year=2003, month=1, day=1)
+        self.date_3 = datetime(year=2003, month=2, day=1)
+
+        InvoiceFactory(
+            CustomerId=self.customer_1.CustomerId, InvoiceDate=self.date_1, Total=Decimal("5.00")
+        )
+        InvoiceFactory(
+            CustomerId=self.customer_1.CustomerId, InvoiceDate=self.date_3, Total=Decimal("6.00")
+        )
+        InvoiceFactory(
+            CustomerId=self.customer_2.CustomerId, InvoiceDate=self.date_2, Total=Decimal("4.00")
+        )
+        InvoiceFactory(
+            CustomerId=self.customer_3.CustomerId, InvoiceDate=self.date_1, Total=Decimal("2.00")
+        )
+        InvoiceFactory(
+            CustomerId=self.customer_3.CustomerId, InvoiceDate=self.date_2, Total=Decimal("1.00")
+        )
+
+    def test_should_create_file_for_each_report(self, session: Session, tmp_path):
+        # act
+        CustomerPaymentsDataService(session).generate_reports(
+            report_classes=[
+                CustomerPaymentsReport,
+                CountryRevenueReport,
+                SupportRepTotalsReport,
+                PurchaseDatesReport,
+            ],
+            path=str(tmp_path)
+        )
+
+        # assert
+        reports_data = self._read_reports(tmp_path)
+
+        assert set(reports_data) == {
+            "customer_payments_data",
+            "country_revenue",
+            "support_rep_totals",
+            "customer_purchase_dates",
+        }
+
+        assert [row["customer_id"] for row in reports_data["customer_payments_data"]] == [
+            self.customer_1.CustomerId,
+            self.customer_2.CustomerId,
+            self.customer_3.CustomerId,
+        ]
+        assert reports_data["country_revenue"] == [
+            {"country": "Norway", "customers_count": 2, "total_paid": "15.00"},
+            {"country": "Chile", "customers_count": 1, "total_paid": "3.00"},
+        ]
+        assert reports_data["support_rep_totals"] == [
+            {"support_rep_id": 1, "customers_count": 1, "total_paid": "11.00"},
+            {"support_rep_id": 2, "customers_count": 2, "total_paid": "7.00"},
+        ]
+        assert reports_data["customer_purchase_dates"] == [
+            {
+                "customer_id": self.customer_1.CustomerId,
+                "first_purchase": str(self.date_1),
+                "last_purchase": str(self.date_3),
+            },
+            {
+                "customer_id": self.customer_2.CustomerId,
+                "first_purchase": str(self.date_2),
+                "last_purchase": str(self.date_2),
+            },
+            {
+                "customer_id": self.customer_3.CustomerId,
+                "first_purchase": str(self.date_1),
+                "last_purchase": str(self.date_2),
+            },
+        ]
+
+    def test_should_apply_date_range_to_all_reports(self, session: Session, tmp_path):
+        # act
+        CustomerPaymentsDataService(session).generate_reports(
+            report_classes=[CountryRevenueReport, PurchaseDatesReport],
+            start_date=self.date_2,
+            path=str(tmp_path)
+        )
+
+        # assert
+        reports_data = self._read_reports(tmp_path)
+
+        assert reports_data["country_revenue"] == [
+            {"country": "Norway", "customers_count": 2, "total_paid": "10.00"},
+            {"country": "Chile", "customers_count": 1, "total_paid": "1.00"},
+        ]
+        assert [row["first_purchase"] for row in reports_data["customer_purchase_dates"]] == [
+            str(self.date_3),
+            str(self.date_2),
+            str(self.date_2),
+        ]
+
+    def test_should_write_empty_arrays_when_no_data(self, session: Session, tmp_path):
+        # act
+        CustomerPaymentsDataService(session).generate_reports(
+            report_classes=[CustomerPaymentsReport, CountryRevenueReport],
+            start_date=datetime(year=2020, month=1, day=1),
+            path=str(tmp_path)
+        )
+
+        # assert
+        assert self._read_reports(tmp_path) == {
+            "customer_payments_data": [],
+            "country_revenue": [],
+        }
+
+    @staticmethod
+    def _read_reports(path) -> dict:
+        reports_data = {}
+        for file_name in os.listdir(path):
+            with open(os.path.join(path, file_name)) as file:
+                reports_data[file_name.rsplit("_", 2)[0]] = simplejson.load(file)
+
+        return reports_data
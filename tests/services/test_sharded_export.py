@@ -0,0 +1,134 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+from sqlalchemy.orm import Session
+
+from db.meta import create_db_engine, get_shard_schemas
+from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.export_planner import ExportPlanner
+
+
+class TestShardedExport:
+    @pytest.fixture(autouse=True)
+    def setup_data(self, tmp_path) -> None:
+        # both shards start invoice ids from 1 and share customer 1
+        self.db_urls = [
+            self._create_shard(
+                tmp_path / "shard_2001.sqlite",
+                customers=[(1, "Luis", "Rojas"), (2, "Helena", "Holy")],
+                invoices=[(1, 1, "2001-01-01 00:00:00", 5.00), (2, 2, "2001-02-01 00:00:00", 4.00)]
+            ),
+            self._create_shard(
+                tmp_path / "shard_2002.sqlite",
+                customers=[(1, "Luis", "Rojas"), (3, "Hugh", "O'Reilly")],
+                invoices=[(1, 1, "2002-01-01 00:00:00", 1.00), (2, 3, "2002-02-01 00:00:00", 3.00)]
+            ),
+        ]
+        self.engine = create_db_engine(self.db_urls)
+
+        yield
+
+        self.engine.dispose()
+
+    def test_should_combine_customers_totals_across_shards(self):
+        # act
+        with Session(self.engine) as session:
+            data = list(
+                CustomerPaymentsDataService(
+                    session, shard_schemas=get_shard_schemas(self.db_urls)
+                )._get_data_generator(batch_size=1)
+            )
+
+        # assert
+        assert [(row["customer_id"], row["total_paid"]) for row in data] == [
+            (1, "6.00"),
+            (2, "4.00"),
+            (3, "3.00"),
+        ]
+        assert data[0]["individual_payments"] == [
+            {"date": "2001-01-01 00:00:00", "amount": "5.00"},
+            {"date": "2002-01-01 00:00:00", "amount": "1.00"},
+        ]
+
+    def test_should_filter_invoices_of_all_shards_by_date(self):
+        # act
+        with Session(self.engine) as session:
+            service = CustomerPaymentsDataService(
+                session, shard_schemas=get_shard_schemas(self.db_urls)
+            )
+            data = list(service._get_data_generator(start_date=datetime(year=2001, month=1, day=15)))
+
+        # assert
+        assert [(row["customer_id"], row["total_paid"]) for row in data] == [
+            (2, "4.00"),
+            (3, "3.00"),
+            (1, "1.00"),
+        ]
+
+    def test_should_estimate_invoices_of_all_shards(self):
+        # act
+        with Session(self.engine) as session:
+            plan = CustomerPaymentsDataService(
+                session, shard_schemas=get_shard_schemas(self.db_urls)
+            ).plan_export(explain=True)
+
+        # assert
+        assert plan.estimated_invoices == 4
+        assert any("shard_1.Invoice" in line for line in plan.query_plan)
+
+    def test_should_count_customers_of_several_shards_once(self):
+        # act
+        with Session(self.engine) as session:
+            customers_count = ExportPlanner(
+                session, get_shard_schemas(self.db_urls)
+            )._get_customers_count()
+
+        # assert
+        assert customers_count == 3
+
+    def test_should_read_only_batch_customers_from_shards(self):
+        # assemble
+        with Session(self.engine) as session:
+            service = CustomerPaymentsDataService(
+                session, shard_schemas=get_shard_schemas(self.db_urls)
+            )
+            ranking_table = service._create_customers_ranking_table(None, None, True)
+            queryset = service._get_customers_data_query(
+                ranking_table.select().where(ranking_table.c.rank <= 1).subquery(),
+                start_date=None,
+                end_date=None,
+                use_date_index=True
+            )
+
+            # act
+            query_plan = ExportPlanner(
+                session, get_shard_schemas(self.db_urls)
+            ).explain_query(queryset.statement)
+
+        # assert
+        assert not [line for line in query_plan if "SCAN" in line and "Invoice" in line]
+        assert "SEARCH shard_1.Invoice USING INDEX IFK_InvoiceCustomerId (CustomerId=?)" in [
+            line.strip() for line in query_plan
+        ]
+
+    @staticmethod
+    def _create_shard(file_path, customers: list, invoices: list) -> str:
+        with open(os.path.join(os.getcwd(), "tests", "testing_schema_generator.sql")) as file:
+            schema = file.read()
+
+        connection = sqlite3.connect(file_path)
+        connection.executescript(schema)
+        connection.executemany(
+            "INSERT INTO Customer (CustomerId, FirstName, LastName, Email) VALUES (?, ?, ?, '')",
+            customers
+        )
+        connection.executemany(
+            "INSERT INTO Invoice (InvoiceId, CustomerId, InvoiceDate, Total) VALUES (?, ?, ?, ?)",
+            invoices
+        )
+        connection.commit()
+        connection.close()
+
+        return str(file_path)
@@ -0,0 +1,145 @@
+import csv
+import os
+import re
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.orm import Session
+
+from services.customer_payments_data_service import CustomerPaymentsDataService
+from services.export_checkpoint import CheckpointError
+from services.reports import CountryRevenueReport, CustomerPaymentsReport
+from services.table_writers import OutputFormat
+from tests.factories import CustomerFactory, InvoiceFactory
+
+
+class TestCustomerPaymentsTablesReport:
+    @pytest.fixture(autouse=True)
+    def setup_data(self) -> None:
+        self.customer_1 = CustomerFactory()
+        self.customer_2 = CustomerFactory()
+
+        self.date_1 = datetime(year=2001, month=1, day=1)
+        self.date_2 = datetime(year=2003, month=1, day=1)
+
+        InvoiceFactory(
+            CustomerId=self.customer_1.CustomerId, InvoiceDate=self.date_1, Total=Decimal("5.96")
+        )
+        InvoiceFactory(
+            CustomerId=self.customer_1.CustomerId, InvoiceDate=self.date_2, Total=Decimal("3.97")
+        )
+        InvoiceFactory(
+            CustomerId=self.customer_2.CustomerId, InvoiceDate=self.date_2, Total=Decimal("1.98")
+        )
+
+    def test_should_write_customers_and_payments_csv_files(self, session: Session, tmp_path):
+        # act
+        CustomerPaymentsDataService(session).generate_reports(
+            report_classes=[CustomerPaymentsReport, CountryRevenueReport],
+            path=str(tmp_path),
+            output_format=OutputFormat.CSV
+        )
+
+        # assert
+        files = self._get_files(tmp_path)
+        assert sorted(files) == [
+            "country_revenue.json",
+            "customer_payments_data_customers.csv",
+            "customer_payments_data_payments.csv",
+        ]
+
+        with open(files["customer_payments_data_customers.csv"], newline="") as file:
+            assert list(csv.reader(file)) == [
+                ["customer_id", "first_name", "last_name", "total_paid", "rank"],
+                [
+                    str(self.customer_1.CustomerId),
+                    self.customer_1.FirstName,
+                    self.customer_1.LastName,
+                    "9.93",
+                    "1",
+                ],
+                [
+                    str(self.customer_2.CustomerId),
+                    self.customer_2.FirstName,
+                    self.customer_2.LastName,
+                    "1.98",
+                    "2",
+                ],
+            ]
+        with open(files["customer_payments_data_payments.csv"], newline="") as file:
+            assert list(csv.reader(file)) == [
+                ["customer_id", "date", "amount"],
+                [str(self.customer_1.CustomerId), str(self.date_1), "5.96"],
+                [str(self.customer_1.CustomerId), str(self.date_2), "3.97"],
+                [str(self.customer_2.CustomerId), str(self.date_2), "1.98"],
+            ]
+
+    def test_should_write_customers_and_payments_parquet_files(self, session: Session, tmp_path):
+        # assemble
+        parquet = pytest.importorskip("pyarrow.parquet")
+
+        # act
+        CustomerPaymentsDataService(session).generate_reports(
+            report_classes=[CustomerPaymentsReport],
+            path=str(tmp_path),
+            output_format=OutputFormat.PARQUET
+        )
+
+        # assert
+        files = self._get_files(tmp_path)
+        assert sorted(files) == [
+            "customer_payments_data_customers.parquet",
+            "customer_payments_data_payments.parquet",
+        ]
+
+        customers = parquet.read_table(files["customer_payments_data_customers.parquet"]).to_pylist()
+        assert [(row["customer_id"], row["total_paid"], row["rank"]) for row in customers] == [
+            (self.customer_1.CustomerId, Decimal("9.93"), 1),
+            (self.customer_2.CustomerId, Decimal("1.98"), 2),
+        ]
+
+        payments = parquet.read_table(
+            files["customer_payments_data_payments.parquet"], columns=["date", "amount"]
+        )
+        assert payments.to_pylist() == [
+            {"date": self.date_1, "amount": Decimal("5.96")},
+            {"date": self.date_2, "amount": Decimal("3.97")},
+            {"date": self.date_2, "amount": Decimal("1.98")},
+        ]
+
+    def test_should_raise_exception_when_resuming_parquet_export(self, tmp_path):
+        # assemble
+        pytest.importorskip("pyarrow")
+        report = CustomerPaymentsReport.create(output_format=OutputFormat.PARQUET)
+
+        # act
+        with pytest.raises(CheckpointError):
+            report.open(
+                report.get_file_paths(str(tmp_path / "customer_payments_data.parquet")),
+                {"positions": [0, 0], "customers_count": 0}
+            )
+
+    def test_should_raise_exception_when_index_requested_for_csv(
+        self, session: Session, tmp_path
+    ):
+        # act
+        with pytest.raises(ValueError, match="JSON"):
+            CustomerPaymentsDataService(session).generate_reports(
+                report_classes=[CustomerPaymentsReport],
+                path=str(tmp_path),
+                with_index=True,
+                output_format=OutputFormat.CSV
+            )
+
+        # assert
+        assert not os.listdir(tmp_path)
+
+    @staticmethod
+    def _get_files(path) -> dict:
+        """Map names of files in the directory without timestamp to their paths."""
+
+        return {
+            re.sub(r"_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}", "", file_name): os.path.join(path, file_name)
+            for file_name in os.listdir(path)
+        }
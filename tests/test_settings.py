@@ -0,0 +1,39 @@
+from settings import split_db_urls
+
+
+class TestSplitDbUrls:
+    def test_should_return_single_url(self):
+        # act
+        db_urls = split_db_urls(":memory:")
+
+        # assert
+        assert db_urls == [":memory:"]
+
+    def test_should_split_comma_separated_urls(self):
+        # act
+        db_urls = split_db_urls("a.sqlite, b.sqlite,")
+
+        # assert
+        assert db_urls == ["a.sqlite", "b.sqlite"]
+
+    def test_should_expand_glob_patterns_in_name_order(self, tmp_path):
+        # assemble
+        for name in ["shard_2.sqlite", "shard_1.sqlite", "other.db"]:
+            (tmp_path / name).touch()
+
+        # act
+        db_urls = split_db_urls(f"main.sqlite,{tmp_path}/shard_*.sqlite")
+
+        # assert
+        assert db_urls == [
+            "main.sqlite",
+            str(tmp_path / "shard_1.sqlite"),
+            str(tmp_path / "shard_2.sqlite"),
+        ]
+
+    def test_should_return_empty_list_when_pattern_matches_nothing(self, tmp_path):
+        # act
+        db_urls = split_db_urls(f"{tmp_path}/*.sqlite")
+
+        # assert
+        assert db_urls == []
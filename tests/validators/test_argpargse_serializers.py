@@ -3,7 +3,13 @@ from datetime import datetime
 
 import pytest
 
-from validators.argpargse_serializers import date_serializer
+from services.reports import CountryRevenueReport, CustomerPaymentsReport
+from services.table_writers import OutputFormat
+from validators.argpargse_serializers import (
+    date_serializer,
+    output_format_serializer,
+    reports_serializer,
+)
 
 
 class TestDateSerializer:
@@ -43,4 +49,54 @@ class TestDateSerializer:
             date_serializer(date)
 
             # assert
-            assert str(err) == f"Not a valid date: {date}. You have to pass date in YYYY-MM-DD format."
\ No newline at end of file
+            assert str(err) == f"Not a valid date: {date}. You have to pass date in YYYY-MM-DD format."
+
+
+class TestReportsSerializer:
+    def test_should_return_report_classes_in_passed_order(self):
+        # assemble
+        value = "country_revenue,customer_payments"
+
+        # act
+        report_classes = reports_serializer(value)
+
+        # assert
+        assert report_classes == [CountryRevenueReport, CustomerPaymentsReport]
+
+    def test_should_ignore_duplicates_and_spaces(self):
+        # assemble
+        value = "customer_payments, customer_payments,"
+
+        # act
+        report_classes = reports_serializer(value)
+
+        # assert
+        assert report_classes == [CustomerPaymentsReport]
+
+    def test_should_raise_exception_when_unknown_report(self):
+        # assemble
+        value = "customer_payments,unknown"
+
+        # act
+        with pytest.raises(ArgumentTypeError) as err:
+            reports_serializer(value)
+
+        # assert
+        assert str(err.value).startswith("Unknown report: unknown.")
+
+
+class TestOutputFormatSerializer:
+    def test_should_return_output_format(self):
+        # act
+        output_format = output_format_serializer("csv")
+
+        # assert
+        assert output_format == OutputFormat.CSV
+
+    def test_should_raise_exception_when_unknown_format(self):
+        # act
+        with pytest.raises(ArgumentTypeError) as err:
+            output_format_serializer("xml")
+
+        # assert
+        assert str(err.value) == "Not a valid format: xml. Available formats: json, csv, parquet."
@@ -1,5 +1,9 @@
 import argparse
 from datetime import datetime
+from typing import List, Type
+
+from services.reports import BaseReport, get_report_classes
+from services.table_writers import OutputFormat
 
 
 def date_serializer(value: str) -> datetime:
@@ -9,3 +13,31 @@ def date_serializer(value: str) -> datetime:
         raise argparse.ArgumentTypeError(
             f"Not a valid date: {value}. You have to pass date in YYYY-MM-DD format."
         )
+
+
+def reports_serializer(value: str) -> List[Type[BaseReport]]:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    if not names:
+        raise argparse.ArgumentTypeError("At least one report name has to be passed.")
+
+    try:
+        return get_report_classes(names)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
+def output_format_serializer(value: str) -> OutputFormat:
+    try:
+        output_format = OutputFormat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Not a valid format: {value}. "
+            f"Available formats: {', '.join(output_format.value for output_format in OutputFormat)}."
+        )
+
+    if not output_format.is_available:
+        raise argparse.ArgumentTypeError(
+            f"Format {value} requires 'pyarrow' package to be installed."
+        )
+
+    return output_format